@@ -0,0 +1,69 @@
+import os
+import time
+from collections import deque
+
+# Entries kept on screen when config.ini doesn't say otherwise
+DEFAULT_RETENTION = 500
+# Identical entries closer together than this are dropped
+DUPLICATE_WINDOW = 2
+
+
+class ActivityLog:
+    """Bounded log of recent activity for the Log tab.
+
+    Entries live in a fixed size ring buffer so memory and insert cost stay flat
+    however long we scan. The buffer is the only copy, the Log tab's RecycleView
+    data is built from it by view_data(). When a persist path is given every
+    entry is also appended to that file.
+    """
+
+    def __init__(self, retention=DEFAULT_RETENTION, persist_path=None):
+        self.retention = max(1, int(retention))
+        self.entries = deque(maxlen=self.retention)
+        self.persist_path = persist_path
+        self.persist_file = None
+        self.last_text = None
+        self.last_time = 0
+
+    def add(self, text, now=None):
+        """Record an entry, returns the stamped text or None if it was a duplicate."""
+        if now is None:
+            now = time.time()
+        # Check for duplication within 2 seconds
+        if self.last_text == text and (now - self.last_time) < DUPLICATE_WINDOW:
+            return None
+        self.last_text = text
+        self.last_time = now
+
+        stamped_text = f'{now}: {text}'
+        self.entries.append(stamped_text)
+        self.persist(stamped_text)
+        return stamped_text
+
+    def persist(self, stamped_text):
+        if self.persist_path is None:
+            return
+        try:
+            if self.persist_file is None:
+                os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+                # Line buffered so every entry hits the file without an explicit flush
+                self.persist_file = open(self.persist_path, 'a', buffering=1)
+            self.persist_file.write(stamped_text + '\n')
+        except OSError as e:
+            print(f"Unable to write activity log: {e}")
+            self.persist_path = None
+
+    def close(self):
+        if self.persist_file is not None:
+            self.persist_file.close()
+            self.persist_file = None
+
+    def view_data(self):
+        """RecycleView data for the entries, newest first."""
+        return [{'text': stamped_text} for stamped_text in reversed(self.entries)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
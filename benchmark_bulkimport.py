@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+from collections import namedtuple
+
+from bulkimport import DEFAULT_WORKERS, BulkImporter
+from radioreference import GetSystems
+from responsecache import ResponseCache
+
+
+Talkgroup = namedtuple('Talkgroup', ['tgDec', 'tgAlpha', 'enc'])
+StandInClient = namedtuple('StandInClient', ['service'])
+
+
+class StandInService:
+    """Local stand-in for the RadioReference SOAP service, answers with synthetic data after a fixed latency."""
+
+    def __init__(self, latency=0.1, site_count=20, talkgroup_count=500):
+        self.latency = latency
+        self.site_count = site_count
+        self.talkgroup_count = talkgroup_count
+
+    def getTrsSites(self, sid, authInfo):
+        time.sleep(self.latency)
+        sid = int(sid)
+        return [{'siteId': sid * 1000 + i, 'siteNumber': str(i), 'rfss': 1, 'siteDescr': f'Site {i}',
+                 'lat': str(40 + i / 100), 'lon': str(-82 - i / 100),
+                 'siteFreqs': [{'freq': str(851.0125 + i / 100), 'use': 'a', 'lcn': i}]}
+                for i in range(1, self.site_count + 1)]
+
+    def getTrsTalkgroups(self, sid, cat_id, tag_id, tg_dec, authInfo):
+        time.sleep(self.latency)
+        return [Talkgroup(i, f'Talkgroup {i}', 0) for i in range(1, self.talkgroup_count + 1)]
+
+
+def benchmark_bulk_import(system_count=24, latency=0.1, workers=DEFAULT_WORKERS, rate=0):
+    """Compare one-at-a-time and parallel imports against the stand-in service.
+
+    The rate limit is off by default so the numbers show what the thread pool
+    buys, with it on both runs end up limited to the same requests per second.
+    """
+    service = StandInService(latency)
+    system_ids = [str(1000 + i) for i in range(system_count)]
+
+    for label, pool_size in (('sequential', 1), (f'{workers} workers', workers)):
+        with tempfile.TemporaryDirectory() as directory:
+            # A fresh response cache each run so every lookup really goes to the service
+            client = GetSystems('', '', cache=ResponseCache(os.path.join(directory, 'cache.db')),
+                                soap_client=StandInClient(service))
+            importer = BulkImporter(client, workers=pool_size, rate=rate, burst=pool_size)
+            start = time.perf_counter()
+            result = importer.import_systems(system_ids, directory)
+            elapsed = time.perf_counter() - start
+        print(f"{label:<12} {len(result.bundles)} systems, {result.requests} requests in {elapsed:.2f} s "
+              f"({len(result.bundles) / elapsed:.1f} systems/s)")
+
+
+# python benchmark_bulkimport.py benchmark [systems] [latency]   time parallel imports against a local stand-in service
+if __name__ == "__main__" and sys.argv[1:2] == ['benchmark']:
+    benchmark_bulk_import(int(sys.argv[2]) if len(sys.argv) > 2 else 24,
+                          float(sys.argv[3]) if len(sys.argv) > 3 else 0.1)
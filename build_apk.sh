@@ -1 +1,2 @@
+if [ -f resources/uszips.csv ]; then python3 zipindex.py build; fi
 buildozer android debug deploy run
@@ -19,7 +19,7 @@ package.domain = org.signalseverywhere
 source.dir = .
 
 # (list) Source files to include (let empty to include all the files)
-source.include_exts = py,png,jpg,kv,atlas,conf,ttf,ini,csv
+source.include_exts = py,png,jpg,kv,atlas,conf,ttf,ini,csv,bin
 
 # (list) List of inclusions using pattern matching
 #source.include_patterns = assets/*,images/*.png
@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from radioreference import BUNDLE_VERSION, plain_site, write_system_database
+
+# Concurrent SOAP requests, matches the connection pool of the shared zeep client
+DEFAULT_WORKERS = 4
+# Requests per second we allow ourselves against RadioReference, and how many may go at once after a pause
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 4
+# Attempts per request and the delay before the first retry, doubled after each failure
+DEFAULT_ATTEMPTS = 3
+RETRY_DELAY = 1.0
+
+ImportResult = namedtuple('ImportResult', ['bundles', 'failed', 'requests', 'elapsed', 'changes'], defaults=(None,))
+
+
+class RateLimiter:
+    """Token bucket shared by every worker, wait() blocks until a request may be sent."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class BulkImporter:
+    """Imports many RadioReference systems at once.
+
+    Sites and talkgroups of every system are fetched concurrently on a thread
+    pool, throttled by a shared rate limiter and retried with backoff. Once
+    everything is in, the system databases are written one after another, each
+    in a single transaction. Fetches go through GetSystems so the response
+    cache still applies.
+    """
+
+    def __init__(self, client, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 attempts=DEFAULT_ATTEMPTS, retry_delay=RETRY_DELAY):
+        self.client = client
+        self.workers = max(1, int(workers))
+        self.limiter = RateLimiter(rate, burst)
+        self.attempts = max(1, int(attempts))
+        self.retry_delay = retry_delay
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def call(self, fetch, *args):
+        """Rate limited call of a GetSystems lookup, retried while it returns None."""
+        delay = self.retry_delay
+        for attempt in range(self.attempts):
+            self.limiter.wait()
+            with self.lock:
+                self.requests += 1
+            result = fetch(*args)
+            if result is not None:
+                return result
+            if attempt + 1 < self.attempts:
+                time.sleep(delay)
+                delay *= 2
+        return None
+
+    def systems_near(self, zip_codes, progress=None):
+        """Trunked systems of the counties the given ZIP codes are in, without duplicates."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            zipcode_infos = list(executor.map(lambda zip_code: self.call(self.client.get_zipcode_info, zip_code),
+                                              zip_codes))
+            county_ids = []
+            for zip_code, zipcode_info in zip(zip_codes, zipcode_infos):
+                if zipcode_info and 'ctid' in zipcode_info:
+                    if zipcode_info['ctid'] not in county_ids:
+                        county_ids.append(zipcode_info['ctid'])
+                else:
+                    print(f"Failed to retrieve zip code information for {zip_code}.")
+            if progress:
+                progress(f"Looking up systems in {len(county_ids)} counties")
+            county_infos = list(executor.map(lambda county_id: self.call(self.client.get_county_info, county_id),
+                                             county_ids))
+
+        systems = {}
+        for county_info in county_infos:
+            if county_info and 'trsList' in county_info:
+                for system in county_info['trsList'] or []:
+                    systems.setdefault(str(system['sid']), system)
+        return list(systems.values())
+
+    def fetch_bundles(self, system_ids, progress=None):
+        """Fetch sites and talkgroups of every system in parallel.
+
+        Returns an ImportResult with the bundles in the order of system_ids and the
+        ids of systems that failed or have no sites.
+        """
+        system_ids = [str(system_id) for system_id in system_ids]
+        start = time.perf_counter()
+        requests_before = self.requests
+        sites = {}
+        talkgroups = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for system_id in system_ids:
+                futures[executor.submit(self.call, self.client.get_trs_sites, system_id)] = (sites, system_id)
+                futures[executor.submit(self.call, self.client.get_trs_talkgroups, system_id)] = (talkgroups, system_id)
+            for future in as_completed(futures):
+                results, system_id = futures[future]
+                results[system_id] = future.result()
+                if progress and system_id in sites and system_id in talkgroups:
+                    progress(f"Fetched system {system_id} ({len(sites)}/{len(system_ids)})")
+
+        bundles = []
+        failed = []
+        for system_id in system_ids:
+            # Sites are essential, a system with no talkgroups can still be scanned
+            if not sites.get(system_id):
+                failed.append(system_id)
+                continue
+            bundles.append({
+                'version': BUNDLE_VERSION,
+                'system_id': system_id,
+                'sites': [plain_site(site) for site in sites[system_id]],
+                'talkgroups': [[int(talkgroup[0]), talkgroup[1]] for talkgroup in talkgroups.get(system_id) or []],
+            })
+        return ImportResult(bundles, failed, self.requests - requests_before, time.perf_counter() - start)
+
+    @staticmethod
+    def write_databases(bundles, directory=os.path.join('resources', 'systems')):
+        """Write the phone side database of every bundle, one transaction each.
+
+        Returns the TalkgroupChanges of each system keyed by system id, and the
+        ids of systems whose database could not be written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        changes = {}
+        failed = []
+        for bundle in bundles:
+            # One bad system must not stop the rest, or the import thread along with it
+            try:
+                changes[bundle['system_id']] = write_system_database(
+                    os.path.join(directory, f"{bundle['system_id']}.db"), bundle['sites'], bundle['talkgroups'] or None)
+            except Exception as e:
+                print(f"Error saving system {bundle['system_id']}: {e}")
+                failed.append(bundle['system_id'])
+        return changes, failed
+
+    def import_systems(self, system_ids, directory=os.path.join('resources', 'systems'), progress=None):
+        result = self.fetch_bundles(system_ids, progress)
+        if progress:
+            progress(f"Saving {len(result.bundles)} systems")
+        changes, failed = self.write_databases(result.bundles, directory)
+        # Systems the phone couldn't store are reported as failed and never sent on to OP25
+        return result._replace(bundles=[bundle for bundle in result.bundles if bundle['system_id'] not in failed],
+                               failed=result.failed + failed, changes=changes)
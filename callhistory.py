@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+
+# Finished calls are written in batches at most this often
+FLUSH_INTERVAL = 5
+# A call that OP25 stops reporting for this long is considered over
+CALL_TIMEOUT = 10
+
+Call = namedtuple('Call', ['tgid', 'tag', 'srcaddr', 'freq', 'system', 'rfid', 'stid', 'start_time', 'end_time'])
+TalkgroupActivity = namedtuple('TalkgroupActivity', ['tgid', 'tag', 'calls', 'airtime', 'last_heard'])
+
+
+class CallHistory:
+    """Persistent record of every call OP25 reports.
+
+    observe() subscribes to OP25Client telemetry and turns the stream of
+    change_freq/trunk_update samples into calls. Finished calls are queued to a
+    writer thread that inserts them in batches, so neither the poll thread nor
+    the UI ever waits on the database.
+    """
+
+    def __init__(self, db_path='resources/config/call_history.db'):
+        self.db_path = db_path
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.active_call = None
+        self.last_active = 0
+        self.create_tables()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def create_tables(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tgid INTEGER,
+                    tag TEXT,
+                    srcaddr INTEGER,
+                    freq INTEGER,
+                    system TEXT,
+                    rfid INTEGER,
+                    stid INTEGER,
+                    start_time REAL,
+                    end_time REAL
+                )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS calls_start_time ON calls (start_time)')
+                conn.execute('CREATE INDEX IF NOT EXISTS calls_tgid_start_time ON calls (tgid, start_time)')
+        finally:
+            conn.close()
+
+    # Recording, runs on the OP25Client poll thread
+
+    def observe(self, snapshot):
+        values = snapshot.values
+        now = snapshot.timestamp
+        change_freq = values.get('change_freq') if values else None
+        trunk_update = (values.get('trunk_update') if values else None) or {}
+
+        tgid = None
+        if change_freq:
+            tgid = change_freq.get('tgid')
+            # Same rule the large display uses, the tgid must be on an active voice channel
+            if tgid is not None and not change_freq.get('tag') and tgid not in snapshot.active_calls.talkgroups:
+                tgid = None
+
+        with self.lock:
+            call = self.active_call
+            if call is not None and tgid != call.tgid:
+                # Call changed or went quiet, only close it once it has really stopped
+                if tgid is not None or now - self.last_active >= CALL_TIMEOUT or not values:
+                    self.finish(call._replace(end_time=self.last_active))
+                    call = self.active_call = None
+
+            if tgid is None:
+                return
+            self.last_active = now
+            srcaddr = trunk_update.get('srcaddr')
+            if call is None:
+                self.active_call = Call(tgid, change_freq.get('tag'), srcaddr, change_freq.get('freq'),
+                                        change_freq.get('system'), trunk_update.get('rfid'),
+                                        trunk_update.get('stid'), now, now)
+            elif srcaddr and srcaddr != call.srcaddr:
+                self.active_call = call._replace(srcaddr=srcaddr)
+
+    def finish(self, call):
+        self.ensure_writer()
+        self.queue.put(call)
+
+    def ensure_writer(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run_writer)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run_writer(self):
+        conn = self.connect()
+        try:
+            running = True
+            while running:
+                batch = []
+                deadline = time.time() + FLUSH_INTERVAL
+                # Gather everything that arrives within one flush interval
+                while True:
+                    try:
+                        item = self.queue.get(timeout=max(0, deadline - time.time()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                if batch:
+                    self.write(conn, batch)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def write(conn, calls):
+        try:
+            with conn:
+                conn.executemany('''
+                INSERT INTO calls (tgid, tag, srcaddr, freq, system, rfid, stid, start_time, end_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', calls)
+        except sqlite3.Error as e:
+            print(f"SQLite error writing call history: {e}")
+
+    def close(self):
+        """Finish the call in progress and wait for everything to be written."""
+        with self.lock:
+            if self.active_call is not None:
+                self.finish(self.active_call._replace(end_time=self.last_active))
+                self.active_call = None
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+
+    # Queries, safe to call from any thread
+
+    def query(self, sql, params=()):
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def calls(self, since, until=None, tgid=None):
+        """Calls that started in [since, until), oldest first."""
+        sql = 'SELECT tgid, tag, srcaddr, freq, system, rfid, stid, start_time, end_time FROM calls WHERE start_time >= ?'
+        params = [since]
+        if until is not None:
+            sql += ' AND start_time < ?'
+            params.append(until)
+        if tgid is not None:
+            sql += ' AND tgid = ?'
+            params.append(tgid)
+        return [Call(*row) for row in self.query(sql + ' ORDER BY start_time', params)]
+
+    def busiest_talkgroups(self, since, limit=10):
+        """Talkgroups with the most airtime since a given time."""
+        rows = self.query('''
+        SELECT tgid, MAX(tag), COUNT(*), SUM(end_time - start_time) AS airtime, MAX(end_time)
+        FROM calls WHERE start_time >= ?
+        GROUP BY tgid ORDER BY airtime DESC, COUNT(*) DESC LIMIT ?
+        ''', (since, limit))
+        return [TalkgroupActivity(*row) for row in rows]
+
+    def talkgroup_activity(self, tgid, since):
+        rows = self.query('''
+        SELECT tgid, MAX(tag), COUNT(*), COALESCE(SUM(end_time - start_time), 0), MAX(end_time)
+        FROM calls WHERE tgid = ? AND start_time >= ?
+        ''', (tgid, since))
+        return TalkgroupActivity(*rows[0]) if rows and rows[0][2] else None
+
+
+# Print the busiest talkgroups of the last hour: python callhistory.py [db] [hours]
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'resources/config/call_history.db'
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+    history = CallHistory(db_path)
+    for activity in history.busiest_talkgroups(time.time() - hours * 3600):
+        print(f"{activity.tgid:>8} {activity.tag or '':<24} {activity.calls:>5} calls {activity.airtime:8.1f}s")
@@ -0,0 +1,93 @@
+import re
+import sys
+import importlib
+import subprocess
+import threading
+
+
+class LazyImport:
+    """Stands in for a module, or an attribute of one, until it is first used.
+
+    Attribute access and calls are passed through to the real object, which is
+    imported the first time either happens. Module level code can then name a
+    heavy dependency without the import cost landing on app startup.
+    """
+
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module_name)
+                    if self._attribute is not None:
+                        target = getattr(target, self._attribute)
+                    self._target = target
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module_name if self._attribute is None else f"{self._module_name}.{self._attribute}"
+        return f"<LazyImport {name}{'' if self.loaded else ' (not loaded)'}>"
+
+
+# Lines of python -X importtime output: "import time: self [us] | cumulative | imported package",
+# nested imports are indented two more spaces than the module importing them
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile_import(module, python=sys.executable):
+    """Import module in a fresh interpreter under -X importtime.
+
+    Returns its cumulative import time in seconds and [(seconds, name)] of the
+    modules it imports directly. Modules the interpreter loaded at startup
+    aren't counted.
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else 'import failed')
+    # Children are reported before their parent, so collect them until the module's own line shows up
+    children = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        depth = len(match.group(3))
+        if depth == 1:
+            if match.group(4) == module:
+                return int(match.group(2)) / 1e6, children
+            children = []
+        elif depth == 3:
+            children.append((int(match.group(2)) / 1e6, match.group(4)))
+    raise RuntimeError(f'{module} not found in -X importtime output')
+
+
+def benchmark_imports(modules, top=8):
+    for module in modules:
+        try:
+            total, children = profile_import(module)
+        except RuntimeError as e:
+            print(f"{module:<20} failed: {e}")
+            continue
+        print(f"{module:<20} {total * 1000:8.1f} ms")
+        for seconds, name in sorted(children, reverse=True)[:top]:
+            print(f"    {name:<28} {seconds * 1000:8.1f} ms")
+
+
+# python lazyimport.py profile [module ...]   import time of each module in a fresh interpreter, with its heaviest imports
+if __name__ == "__main__" and sys.argv[1:2] == ['profile']:
+    benchmark_imports(sys.argv[2:] or ['radioreference', 'bulkimport', 'zeep', 'plyer'])
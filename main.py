@@ -10,36 +10,53 @@ sudo apt install cython buildozer
 
 #############'''
 
-import configparser
+# Imported first, startup timing counts from here and so includes importing Kivy and the rest of the app
+from startuptimer import StartupTimer
+from lazyimport import LazyImport
+
 from kivymd.app import MDApp
 from kivy.lang import Builder
-from kivy.uix.label import Label
 from kivy.properties import StringProperty
 from kivy.clock import Clock, mainthread
 from kivy.core.text import LabelBase
+from kivy.core.window import Window
 from kivy.uix.spinner import Spinner
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.tabbedpanel import TabbedPanelItem
+from kivy.factory import Factory
 from kivymd.uix.button import MDFlatButton
 from kivymd.uix.dialog import MDDialog
 from kivy.utils import platform
 from threading import Thread
-from plyer import gps
 import sqlite3
 import time
 import re
 import os
 
-from kivy.uix.screenmanager import Screen
-import csv
-from math import radians, sin, cos, sqrt, atan2
+from kivy.uix.screenmanager import Screen, ScreenManager
 
 import updater
 # Local Imports
-from updater import OP25Client
+from updater import OP25Client, has_changed
 from resources.config import configure
-from radioreference import GetSystems
+from radioreference import GetSystems, bundle_chunks, describe_changes
+from bulkimport import BulkImporter
+from zipindex import ZipIndex
+from sitelocator import SiteLocator
+from talkgroupindex import TalkgroupIndex
+from siteswitcher import SiteSwitcher
+from sitequality import SiteQuality
+from activitylog import ActivityLog, DEFAULT_RETENTION
+from callhistory import CallHistory
+from scangrid import ScanGridModel, PAGE_SIZE, bank_button_numbers, button_id, default_buttons
+
+startup_timer = StartupTimer()
+startup_timer.mark("imports")
 
 # Load config file
-config = configure.Configure('resources/config/config.ini')
+config = configure.get_config('resources/config/config.ini')
+# Not saved until the credentials screen is first used
+rr_credentials = configure.get_config('resources/config/rr_credentials.ini', required=False)
 
 TIME24 = config.get_bool(section='RCH', option='TIME24')
 
@@ -51,8 +68,44 @@ GLOBAL_OP25IP = config.get(section='RCH', option='op25_ip')
 GLOBAL_OP25PORT = config.get(section='RCH', option='op25_port')
 GLOBAL_TAGS_ENABLED = False
 
+# plyer is only imported once GPS is first started
+gps = LazyImport('plyer', 'gps')
+
+# Quiet time after the last ScanGrid toggle before the whitelist is sent to OP25
+WHITELIST_PUSH_DELAY = 1.0
+
+# First entry of the import spinner when a lookup returns more than one system
+ALL_SYSTEMS = "All listed systems"
+
 # Screen Classes
 
+# Screens other than Main are built from their own kv file the first time they are opened
+LAZY_SCREENS = {
+    'SettingsLocalConfig': 'kv/settings_local_config.kv',
+    'SettingsOP25Config': 'kv/settings_op25_config.kv',
+    'SettingsScanGridConfig': 'kv/settings_scangrid_config.kv',
+    'SettingsRRCredentials': 'kv/settings_rr_credentials.kv',
+    'SettingsRRImport': 'kv/settings_rr_import.kv',
+    'SettingsRRSelect': 'kv/settings_rr_select.kv',
+}
+
+
+class LazyScreenManager(ScreenManager):
+    # Navigating to a screen and get_screen() both go through here, so a screen is built on first use
+    def get_screen(self, name):
+        if name not in self.screen_names and name in LAZY_SCREENS:
+            self.build_screen(name)
+        return super().get_screen(name)
+
+    def build_screen(self, name):
+        with startup_timer.measure(f"build {name}"):
+            Builder.load_file(LAZY_SCREENS[name])
+            screen = Factory.get(name)(name=name)
+            self.add_widget(screen)
+        print(f"Built screen {name} in {startup_timer.durations[-1][1] * 1000:.0f} ms")
+        MDApp.get_running_app().on_screen_built(name)
+
+
 # Our Main Screen
 class Main(Screen):
     pass
@@ -74,22 +127,11 @@ class SettingsRRCredentials(Screen):
 
     # Load our credentials into the screen
     def load_rr_credentials(self):
-        config_path = 'resources/config/rr_credentials.ini'
-
-        if os.path.exists(config_path):
-            config = configparser.ConfigParser()
-            config.read(config_path)
-
-            if config.has_section('RadioReference'):
-                username = config.get('RadioReference', 'username', fallback='')
-                password = config.get('RadioReference', 'password', fallback='')
-
-                self.ids.username.text = username
-                self.ids.password.text = password
-            else:
-                print("Section 'RadioReference' not found in the config file.")
+        if rr_credentials.has_section('RadioReference'):
+            self.ids.username.text = rr_credentials.get('RadioReference', 'username', fallback='')
+            self.ids.password.text = rr_credentials.get('RadioReference', 'password', fallback='')
         else:
-            print("Config file not found.")
+            print("Section 'RadioReference' not found in the config file.")
 
 class SettingsRRImport(Screen):
     pass
@@ -101,6 +143,7 @@ class MainApp(MDApp):
     time_text = StringProperty()
     signal_icon = StringProperty()
     gps_icon = StringProperty()
+    sdr_info = StringProperty()
     op25_server_address = StringProperty()
 
     # Detailed display variables
@@ -115,16 +158,39 @@ class MainApp(MDApp):
     gps_location = StringProperty()
     gps_status = StringProperty('Click Start to get GPS location updates')
 
-    zip_code_data = []
+    zip_index = None
+    gps_configured = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.op25client = OP25Client(f'http://{GLOBAL_OP25IP}:{GLOBAL_OP25PORT}', self.process_latest_values)
         self.is_active = False  # Flag to control data fetching
-        self.sdr_info = "SDR: N/A | LNA: N/A | SR: N/A"  # Initialize the property
-        self.previous_site_id = None
-        self.last_log_entry = None
-        self.last_log_time = 0
+        self.update_sdr_info()
+        # Settings screens save through config, these keep the display in step without re-reading it
+        config.subscribe(self.update_sdr_info, section='SDR')
+        config.subscribe(self.on_local_config_change, section='RCH')
+        self.site_locator = SiteLocator()
+        self.talkgroup_index = TalkgroupIndex()
+        self.site_quality = SiteQuality()
+        self.site_switcher = SiteSwitcher(quality=self.site_quality)
+        self.op25client.subscribe(self.site_quality.observe)
+        self.call_history = CallHistory()
+        self.op25client.subscribe(self.call_history.observe)
+        self.scangrid = None
+        self.last_whitelist = None
+        self.trunk_settings = None
+        # ScanGrid widgets are only built for banks that have been shown
+        self.scangrid_bank = 0
+        self.scangrid_bank_tabs = {}
+        self.scangrid_config_rows = {}
+        self.scangrid_widgets = {}
+        # Bursts of toggles are coalesced into one WRITE_WHITELIST once they settle
+        self.whitelist_push = Clock.create_trigger(self.send_active_buttons_to_whitelist, WHITELIST_PUSH_DELAY)
+        # Log entries added during a frame reach the Log tab in one update before the next frame
+        self.log_view_refresh = Clock.create_trigger(self.refresh_log_view)
+        self.activity_log = ActivityLog(
+            retention=config.get_int(section='RCH', option='log_retention', fallback=DEFAULT_RETENTION),
+            persist_path='resources/logs/activity.log' if config.get_bool(section='RCH', option='log_to_file') else None)
 
         # Spinners are the drop down boxes we use
         self.sdr_spinner = Spinner(
@@ -227,7 +293,9 @@ class MainApp(MDApp):
     def build(self):
         #self.theme_cls.theme_style = "Light"
         self.theme_cls.primary_palette = "Orange"
-        root = Builder.load_file("main.kv")
+        startup_timer.mark("build")
+        with startup_timer.measure("load main.kv"):
+            root = Builder.load_file("main.kv")
 
 
         # Load our fonts
@@ -241,36 +309,46 @@ class MainApp(MDApp):
         Clock.schedule_once(self.initialize_settings, 0.1)
         Clock.schedule_once(self.delayed_theme_application)
         Clock.schedule_interval(self.update_time, 1)
-        Clock.schedule_interval(self.check_status_and_update, 5)
-
-        Clock.schedule_once(lambda dt: self.populate_system_selection_spinner(), 0.1)
 
 
 
 
-        # This is for our GPS
-        try:
-            gps.configure(on_location=self.on_location,
-                          on_status=self.on_status)
-        except NotImplementedError:
-            import traceback
-            traceback.print_exc()
-            self.gps_status = 'GPS is not implemented for your platform'
-
         if platform == "android":
             print("gps.py: Android detected. Requesting permissions")
             self.request_android_permissions()
-            self.load_zip_code_data()
 
 
         return root
 
     def on_start(self):
+        startup_timer.mark("on_start")
         # This is the updater thread and it runs constant queries to OP25
         self.start_thread()
-        self.check_existance_of_scangrid_database()
-        self.populate_scangrid()
-        self.update_scangrid_config()
+        # Everything else waits until the first frame is on screen
+        Window.bind(on_flip=self.on_first_frame)
+
+    def on_first_frame(self, *args):
+        Window.unbind(on_flip=self.on_first_frame)
+        startup_timer.mark("first frame")
+        Clock.schedule_once(self.after_first_frame, 0)
+
+    def after_first_frame(self, dt):
+        with startup_timer.measure("ScanGrid bank 1"):
+            self.ensure_scangrid()
+            self.show_scangrid_bank(self.scangrid_bank)
+        print("Startup timing:\n" + startup_timer.report())
+
+    def screen_built(self, name):
+        return name in self.root.screen_names
+
+    def on_screen_built(self, name):
+        # Fill in a settings screen the first time it exists
+        if name == 'SettingsLocalConfig':
+            self.show_local_settings()
+        elif name == 'SettingsOP25Config':
+            self.show_op25_settings()
+        elif name == 'SettingsRRSelect':
+            self.populate_system_selection_spinner()
 
 
 
@@ -343,6 +421,9 @@ class MainApp(MDApp):
 
     def update_rr_selected_system(self, selected_system):
         config.set('RR', 'selected_system', selected_system)
+        self.site_locator.invalidate()
+        self.talkgroup_index.invalidate()
+        self.site_switcher.reset()
         if platform == 'android':
             #self.test_site_switching(selected_system)
             self.populate_sitelock_spinner(selected_system)
@@ -352,25 +433,38 @@ class MainApp(MDApp):
 
     def stop_site_switching(self):
         self.stop() # Stop the GPS
+        self.site_switcher.reset()
         self.op25client.stop_op25() # Stop OP25
         self.gps_icon = "󰽅"
 
 
     def update_rr_import_spinner(self, zipcode):
-        # Read the configuration file
-        self.config.read('resources/config/rr_credentials.ini')
-
         # Get the username and password
-        username = self.config.get('RadioReference', 'username')
-        password = self.config.get('RadioReference', 'password')
+        username = rr_credentials.get('RadioReference', 'username')
+        password = rr_credentials.get('RadioReference', 'password')
+
+        def run():
+            client = GetSystems(username=username, password=password)
 
-        client = GetSystems(username=username, password=password)
+            # Several ZIP codes cover a whole region, their counties are looked up in parallel
+            zip_codes = [zip_code for zip_code in re.split(r'[,\s]+', zipcode) if zip_code]
+            if len(zip_codes) > 1:
+                systems = BulkImporter(client).systems_near(zip_codes)
+            else:
+                systems = client.get_systems_in_county(zip_code=zipcode)
+            print(systems)
+            self.show_rr_import_systems(systems)
 
-        systems = client.get_systems_in_county(zip_code=zipcode)
-        print(systems)
+        # SOAP lookups with retries can take seconds, keep them off the UI thread
+        Thread(target=run, daemon=True).start()
 
+    @mainthread
+    def show_rr_import_systems(self, systems):
         # Update spinner values with system IDs and names
-        self.root.get_screen('SettingsRRImport').ids.import_system_spinner.values = [f"System ID: {system['sid']}, Name: {system['sName']}" for system in systems]
+        values = [f"System ID: {system['sid']}, Name: {system['sName']}" for system in systems]
+        if len(values) > 1:
+            values.insert(0, ALL_SYSTEMS)
+        self.root.get_screen('SettingsRRImport').ids.import_system_spinner.values = values
 
         # Make the spinner visible in the UI
         self.root.get_screen('SettingsRRImport').ids.import_system_spinner.opacity = 1
@@ -378,36 +472,73 @@ class MainApp(MDApp):
         # Make the download system button visible in UI
         self.root.get_screen('SettingsRRImport').ids.download_system_button.opacity = 1
 
+    @mainthread
+    def report_import_progress(self, text):
+        # Called from the import thread as each step starts
+        if self.dialog:
+            self.dialog.text = text
+        self.add_log_entry(text)
+
     def download_rr_system(self, selection):
 
         if not self.dialog:
-            self.dialog = MDDialog(text="SYSTEM CREATION STARTED")
+            self.dialog = MDDialog(text="Starting system import")
+        else:
+            self.dialog.text = "Starting system import"
         self.dialog.open()
 
-        def run():
-            # Regular expression pattern to extract the system ID
-            pattern = r'System ID: (\d+),'
-
+        # Regular expression pattern to extract the system ID
+        pattern = r'System ID: (\d+),'
+        if selection == ALL_SYSTEMS:
+            spinner_values = self.root.get_screen('SettingsRRImport').ids.import_system_spinner.values
+            system_ids = re.findall(pattern, '\n'.join(spinner_values))
+        else:
             # Using re.findall to find all matches of the pattern in the input string
-            matches = re.findall(pattern, selection)
-
-            # Extract the system ID (assuming there's only one match)
-            if matches:
-                system_id = matches[0]
-                # Read the configuration file
-                self.config.read('resources/config/rr_credentials.ini')
+            system_ids = re.findall(pattern, selection)[:1]
 
+        def run():
+            if system_ids:
                 # Get the username and password
-                username = self.config.get('RadioReference', 'username')
-                password = self.config.get('RadioReference', 'password')
+                username = rr_credentials.get('RadioReference', 'username')
+                password = rr_credentials.get('RadioReference', 'password')
 
                 client = GetSystems(username=username, password=password)
 
-                client.create_system_database(system_id)
-
-                print('Creating System on Pi')
-                self.op25client.send_cmd_to_op25(f'CREATE_SYSTEM;{username};{password};{system_id}')
-
+                if len(system_ids) > 1:
+                    # Fetch every system in parallel and write all phone databases in one go
+                    result = BulkImporter(client).import_systems(system_ids, progress=self.report_import_progress)
+                    self.talkgroup_index.invalidate()
+                    not_sent = [bundle['system_id'] for bundle in result.bundles
+                                if not self.send_bundle_to_op25(bundle, username, password)]
+                    self.report_import_progress(f"Imported {len(result.bundles)} systems in {result.elapsed:.1f} s"
+                                                + (f", failed: {', '.join(result.failed)}" if result.failed else "")
+                                                + (f", not accepted by OP25: {', '.join(not_sent)}" if not_sent else ""))
+                    return
+
+                system_id = system_ids[0]
+                # Fetch sites and talkgroups once, then hand the same data to the phone and the Pi
+                bundle = client.fetch_system_bundle(system_id, progress=self.report_import_progress)
+                if bundle is None:
+                    self.report_import_progress(f"No sites found for system {system_id}")
+                    return
+
+                self.report_import_progress("Saving system on phone")
+                # Re-importing a system only applies the talkgroup changes, whitelists are kept
+                try:
+                    changes = client.create_system_database(system_id, bundle=bundle)
+                except Exception as e:
+                    # Don't hand the Pi a system the phone couldn't store
+                    print(f"Error saving system {system_id}: {e}")
+                    self.report_import_progress(f"System {system_id} could not be saved on phone: {e}")
+                    return
+                self.talkgroup_index.invalidate()
+
+                if not self.send_bundle_to_op25(bundle, username, password):
+                    self.report_import_progress(f"System {system_id} saved on phone, but OP25 did not accept it")
+                    return
+
+                self.report_import_progress(f"System {system_id} imported ({len(bundle['sites'])} sites, "
+                                            f"{describe_changes(changes)})")
                 print(f"System ID extracted: {system_id}")
             else:
                 print("System ID not found.")
@@ -417,34 +548,58 @@ class MainApp(MDApp):
         # Start the thread
         thread.start()
 
+    def send_bundle_to_op25(self, bundle, username, password):
+        """Hand a system to the Pi, returns True if it accepted it."""
+        system_id = bundle['system_id']
+        self.report_import_progress(f"Sending system {system_id} to OP25")
+        if self.op25client.supports('IMPORT_SYSTEM'):
+            chunks = bundle_chunks(bundle)
+            for index, chunk in enumerate(chunks):
+                response = self.op25client.send_cmd_to_op25(
+                    f'IMPORT_SYSTEM;{system_id};{index};{len(chunks)};{chunk}')
+                if 'ACK' not in response or 'NACK' in response:
+                    print(f'IMPORT_SYSTEM of {system_id} failed at chunk {index + 1}/{len(chunks)}: {response}')
+                    break
+            else:
+                return True
+
+        # Older servers don't know IMPORT_SYSTEM, or it failed, let the Pi fetch the system itself
+        print('Creating System on Pi')
+        response = self.op25client.send_cmd_to_op25(f'CREATE_SYSTEM;{username};{password};{system_id}')
+        return response != 'FAIL' and 'NACK' not in response
+
     def set_sitelock(self, system_id, site_id):
         # Before we lock the site we must ensure the GPS functionality is disabled as that controls site switching directly
         self.stop()
+        self.site_switcher.reset()
 
         match_site = re.match(r"^\d+(?=:)", site_id)[0]
-        self.op25client.send_cmd_to_op25(f'SITELOCK;{system_id};{match_site}')
+        self.op25client.send_cmd_to_op25_async(f'SITELOCK;{system_id};{match_site}')
 
         self.root.get_screen('Main').ids.system_county.text = site_id
 
     # Update config for local settings
     def update_config(self):
-        config.set('RCH', 'TIME24', str(self.root.get_screen('SettingsLocalConfig').ids.time24_checkbox.active))
-        config.set('RCH', 'op25_ip', self.root.get_screen('SettingsLocalConfig').ids.op25_ip_textbox.text)
-        config.set('RCH', 'op25_port', self.root.get_screen('SettingsLocalConfig').ids.op25_port_textbox.text)
-        config.set('RCH', 'mch_port', self.root.get_screen('SettingsLocalConfig').ids.mch_port_textbox.text)
+        # One save for the whole screen
+        with config.batch():
+            config.set('RCH', 'TIME24', str(self.root.get_screen('SettingsLocalConfig').ids.time24_checkbox.active))
+            config.set('RCH', 'op25_ip', self.root.get_screen('SettingsLocalConfig').ids.op25_ip_textbox.text)
+            config.set('RCH', 'op25_port', self.root.get_screen('SettingsLocalConfig').ids.op25_port_textbox.text)
+            config.set('RCH', 'mch_port', self.root.get_screen('SettingsLocalConfig').ids.mch_port_textbox.text)
 
 
     # Update OP25 Specific settings
     def update_op25_settings(self):
-        # Save the SDR Selection to Config.ini
-        config.set('SDR', 'sdr', self.root.get_screen('SettingsOP25Config').ids.sdr_spinner.text)
-        # Save the SDR Sample Rate to Config.ini
-        config.set('SDR', 'samplerate', self.root.get_screen('SettingsOP25Config').ids.sample_rate_spinner.text)
-        # Save the SDR gain to Config.ini
-        config.set('SDR', 'gain', self.root.get_screen('SettingsOP25Config').ids.gain_spinner.text)
-        # Save the manual start on boot option
-        is_active = self.root.get_screen('SettingsOP25Config').ids.manual_on_boot.active
-        config.set('SDR', 'manualonboot', is_active)
+        with config.batch():
+            # Save the SDR Selection to Config.ini
+            config.set('SDR', 'sdr', self.root.get_screen('SettingsOP25Config').ids.sdr_spinner.text)
+            # Save the SDR Sample Rate to Config.ini
+            config.set('SDR', 'samplerate', self.root.get_screen('SettingsOP25Config').ids.sample_rate_spinner.text)
+            # Save the SDR gain to Config.ini
+            config.set('SDR', 'gain', self.root.get_screen('SettingsOP25Config').ids.gain_spinner.text)
+            # Save the manual start on boot option
+            is_active = self.root.get_screen('SettingsOP25Config').ids.manual_on_boot.active
+            config.set('SDR', 'manualonboot', is_active)
 
 
         sysname = self.root.get_screen('SettingsOP25Config').ids.op25_config_sysname.text
@@ -452,31 +607,26 @@ class MainApp(MDApp):
         tglist = self.root.get_screen('SettingsOP25Config').ids.op25_config_talkgroup_list.text
 
         # Take data in the trunk settings fields and send them to the server for updating
-        self.op25client.send_cmd_to_op25(command=f'WRITE_TRUNK;sysname={sysname};cclist={cclist};tglist={tglist}')
+        self.op25client.send_cmd_to_op25_async(command=f'WRITE_TRUNK;sysname={sysname};cclist={cclist};tglist={tglist}')
 
     def write_systemscan(self, selected_system):
-        self.op25client.send_cmd_to_op25(command=f'WRITE_SCANMODE;system={selected_system};mode=system')
+        self.op25client.send_cmd_to_op25_async(command=f'WRITE_SCANMODE;system={selected_system};mode=system')
 
 
     def write_gridscan(self, selected_system):
-        self.op25client.send_cmd_to_op25(command=f'WRITE_SCANMODE;system={selected_system};mode=grid')
+        self.op25client.send_cmd_to_op25_async(command=f'WRITE_SCANMODE;system={selected_system};mode=grid')
 
 
 
     # Read OP25 specific settings
     def read_op25_settings(self):
-        # Update UI With SDR Selection from Config.ini
-        self.root.get_screen('SettingsOP25Config').ids.sdr_spinner.text = config.get('SDR', 'sdr')
-        # Update UI With SDR Sample Rate from Config.ini
-        self.root.get_screen('SettingsOP25Config').ids.sample_rate_spinner.text = config.get('SDR', 'samplerate')
-        # Update UI With SDR gain from Config.ini
-        self.root.get_screen('SettingsOP25Config').ids.gain_spinner.text = config.get('SDR', 'gain')
-
-        # Update Large Display SDR Details
-
-        # send a command to read trunk file and assign it to variable trunk_data
-        trunk_data = self.op25client.send_cmd_to_op25('READ_TRUNK')
+        # READ_TRUNK is answered on the control channel worker so startup never waits on the Pi
+        future = self.op25client.send_cmd_to_op25_async('READ_TRUNK')
+        future.add_done_callback(lambda future: self.apply_trunk_settings(future.result()))
+        self.show_op25_settings()
 
+    @mainthread
+    def apply_trunk_settings(self, trunk_data):
         # Regex pattern to extract sysname, cclist, and tglist
         pattern = r"sysname=([^;]*);cclist=([^;]*);tglist=([^;]*)"
         # Perform regex search
@@ -491,14 +641,32 @@ class MainApp(MDApp):
             else:
                 GLOBAL_TAGS_ENABLED = False
 
-            # Set trunk details in the UI
-            self.root.get_screen('SettingsOP25Config').ids.op25_config_sysname.text = sysname
-            self.root.get_screen('SettingsOP25Config').ids.op25_config_controlchannels.text = cclist
-            self.root.get_screen('SettingsOP25Config').ids.op25_config_talkgroup_list.text = tglist
+            self.trunk_settings = (sysname, cclist, tglist)
+            self.show_op25_settings()
             self.add_log_entry('Read OP25 Settings from Server')
         else:
             print("ERROR: Unable to read trunk from server")
 
+    def show_op25_settings(self):
+        # Nothing to fill in until the screen has been opened
+        if not self.screen_built('SettingsOP25Config'):
+            return
+        screen = self.root.get_screen('SettingsOP25Config')
+        # Update UI With SDR Selection from Config.ini
+        screen.ids.sdr_spinner.text = config.get('SDR', 'sdr')
+        # Update UI With SDR Sample Rate from Config.ini
+        screen.ids.sample_rate_spinner.text = config.get('SDR', 'samplerate')
+        # Update UI With SDR gain from Config.ini
+        screen.ids.gain_spinner.text = config.get('SDR', 'gain')
+        screen.ids.manual_on_boot.active = config.get_bool('SDR', 'manualonboot')
+
+        if self.trunk_settings is not None:
+            # Set trunk details in the UI
+            sysname, cclist, tglist = self.trunk_settings
+            screen.ids.op25_config_sysname.text = sysname
+            screen.ids.op25_config_controlchannels.text = cclist
+            screen.ids.op25_config_talkgroup_list.text = tglist
+
 
     # Save Radio Refernce Credentials
     def save_rr_credentials(self):
@@ -506,38 +674,19 @@ class MainApp(MDApp):
         username = self.root.get_screen('SettingsRRCredentials').ids.username.text
         password = self.root.get_screen('SettingsRRCredentials').ids.password.text
 
-        # Path to the config file
-        config_path = 'resources/config/rr_credentials.ini'
-
-        # Ensure the config directory exists
-        os.makedirs(os.path.dirname(config_path), exist_ok=True)
-
-        # Create a ConfigParser object
-        config = configparser.ConfigParser()
-
-        # Read existing config if the file exists
-        if os.path.exists(config_path):
-            config.read(config_path)
-
-        # Update or set the credentials in the 'RadioReference' section
-        if not config.has_section('RadioReference'):
-            config.add_section('RadioReference')
-
-        config.set('RadioReference', 'username', username)
-        config.set('RadioReference', 'password', password)
-
-        # Write the config to the file
-        with open(config_path, 'w') as configfile:
-            config.write(configfile)
+        # Both credentials are written to rr_credentials.ini in one save
+        with rr_credentials.batch():
+            rr_credentials.set('RadioReference', 'username', username)
+            rr_credentials.set('RadioReference', 'password', password)
 
         # Return to main screen
         self.root.current = 'Main'
 
     # Increase and decrease volume commands
     def increase_volume(self):
-        self.op25client.send_cmd_to_op25(command="INCREASE_VOLUME")
+        self.op25client.send_cmd_to_op25_async(command="INCREASE_VOLUME")
     def decrease_volume(self):
-        self.op25client.send_cmd_to_op25(command="DECREASE_VOLUME")
+        self.op25client.send_cmd_to_op25_async(command="DECREASE_VOLUME")
 
     def start_thread(self):
         if not self.op25client.is_running():
@@ -551,23 +700,20 @@ class MainApp(MDApp):
 
 
     def initialize_settings(self, *args):
-        self.root.get_screen('SettingsLocalConfig').ids.op25_ip_textbox.text = config.get(section='RCH', option='op25_ip')
-        self.root.get_screen('SettingsLocalConfig').ids.op25_port_textbox.text = config.get(section='RCH', option='op25_port')
-        self.root.get_screen('SettingsLocalConfig').ids.mch_port_textbox.text = config.get(section='RCH', option='mch_port')
-        self.root.get_screen('SettingsLocalConfig').ids.time24_checkbox.active = config.get_bool(section='RCH', option='TIME24')
-
-
-
         # Get the boolean value
         manual_on_boot_active = config.get_bool('SDR', 'manualonboot')
 
-        # Set the active state of our switch
-        self.root.get_screen('SettingsOP25Config').ids.manual_on_boot.active = manual_on_boot_active
-
-        # Start manual op25 if value is true
+        # Start manual op25 if value is true, off the UI thread as it waits for the Pi to answer
         if manual_on_boot_active:
             print("Manual on boot is enabled")
-            self.op25client.manual_start_op25()
+            Thread(target=self.op25client.manual_start_op25, daemon=True).start()
+
+    def show_local_settings(self):
+        screen = self.root.get_screen('SettingsLocalConfig')
+        screen.ids.op25_ip_textbox.text = config.get(section='RCH', option='op25_ip')
+        screen.ids.op25_port_textbox.text = config.get(section='RCH', option='op25_port')
+        screen.ids.mch_port_textbox.text = config.get(section='RCH', option='mch_port')
+        screen.ids.time24_checkbox.active = config.get_bool(section='RCH', option='TIME24')
 
     def update_time(self, *args):
         if TIME24:
@@ -575,15 +721,10 @@ class MainApp(MDApp):
         else:
             self.time_text = time.strftime("%I:%M:%S %p")
 
-    def check_status_and_update(self, *args):
-        if self.is_active and self.op25client.is_running():
-            latest_values = self.op25client.get_latest_values()
-            self.update_signal_icon(latest_values)
-            self.update_large_display(latest_values)
-            self.update_detailed_display(latest_values)
-            self.update_connection_status()
-
-    def update_signal_icon(self, latest_values):
+    def update_signal_icon(self, latest_values, changes):
+        # Only recompute the icon when the tsbk count moves
+        if not has_changed(changes, 'trunk_update', 'tsbks'):
+            return
         try:
             if latest_values and 'trunk_update' in latest_values:
                 tsbks_value = latest_values['trunk_update'].get('tsbks')
@@ -604,71 +745,24 @@ class MainApp(MDApp):
             print(f"Error updating signal icon: {e}")
 
 
-    def update_detailed_display(self, latest_values):
-        # Check and set 'change_freq' data
-        if 'change_freq' in latest_values:
-            change_freq_data = latest_values['change_freq']
-            freq = change_freq_data.get("freq")
-            tgid = change_freq_data.get("tgid")
-            offset = change_freq_data.get("offset")
-            tag = change_freq_data.get("tag")
-            nac = change_freq_data.get("nac")
-            system = change_freq_data.get("system")
-            center_frequency = change_freq_data.get("center_frequency")
-            tdma = change_freq_data.get("tdma")
-            wacn = change_freq_data.get("wacn")
-            sysid = change_freq_data.get("sysid")
-            tuner = change_freq_data.get("tuner")
-            sigtype = change_freq_data.get("sigtype")
-            fine_tune = change_freq_data.get("fine_tune")
-            error = change_freq_data.get("error")
-            stream_url = change_freq_data.get("stream_url")
-
-
-
-
-
-        # Check and set 'trunk_update' data
-        if 'trunk_update' in latest_values:
-            trunk_update_data = latest_values['trunk_update']
-
-            top_line = trunk_update_data.get("top_line")
-            self.detailed_topline = str(top_line)
-
-            syid = trunk_update_data.get("syid")
-            rfid = trunk_update_data.get("rfid")
-            stid = trunk_update_data.get("stid")
-            sysid = trunk_update_data.get("sysid")
-            grpaddr = trunk_update_data.get("grpaddr")
-            srcaddr = trunk_update_data.get("srcaddr")
-            encrypted = trunk_update_data.get("encrypted")
-            rxchan = trunk_update_data.get("rxchan")
-            txchan = trunk_update_data.get("txchan")
-            wacn = trunk_update_data.get("wacn")
-            secondary = trunk_update_data.get("secondary")
-            frequencies = trunk_update_data.get("frequencies")
-            frequency_data = trunk_update_data.get("frequency_data")
-            last_tsbk = trunk_update_data.get("last_tsbk")
-            tsbks = trunk_update_data.get("tsbks")
-            adjacent_data = trunk_update_data.get("adjacent_data")
-
-            self.detailed_radio_id = str(srcaddr)
-            self.detailed_talkgroup_id = str(grpaddr)
-
-
-
-
+    def update_detailed_display(self, latest_values, changes):
+        # Only the fields that changed since the last poll are pushed to the UI
+        trunk_changes = changes.get('trunk_update')
+        if trunk_changes:
+            if 'top_line' in trunk_changes:
+                self.detailed_topline = str(trunk_changes['top_line'])
+            if 'srcaddr' in trunk_changes:
+                self.detailed_radio_id = str(trunk_changes['srcaddr'])
+            if 'grpaddr' in trunk_changes:
+                self.detailed_talkgroup_id = str(trunk_changes['grpaddr'])
 
-        # Check and set 'rx_update' data
-        if 'rx_update' in latest_values:
-            rx_update_data = latest_values['rx_update']
-            error = rx_update_data.get("error")
-            fine_tune = rx_update_data.get("fine_tune")
-            files = rx_update_data.get("files")
 
 
-
-    def update_large_display(self, latest_values):
+    def update_large_display(self, latest_values, changes, active_calls):
+        # Skip the work entirely unless something shown on the large display changed
+        if not (has_changed(changes, 'change_freq', 'system', 'tag', 'tgid')
+                or has_changed(changes, 'trunk_update', 'frequency_data')):
+            return
         try:
             if GLOBAL_TAGS_ENABLED:
                 if latest_values is not None and 'trunk_update' in latest_values:
@@ -695,17 +789,18 @@ class MainApp(MDApp):
                     system_name = latest_values['change_freq'].get('system')
                     current_talkgroup = latest_values['change_freq'].get('tgid')
 
-                    active_tgids = []
-                    for freq, freq_data in latest_values['trunk_update']['frequency_data'].items():
-                        active_tgids.extend(filter(None, freq_data['tgids']))
-
                     if system_name is not None:
                         self.root.get_screen('Main').ids.system_name.text = system_name
                         self.detailed_system_name = system_name
                     if current_talkgroup is not None:
-                        if int(current_talkgroup) in active_tgids:
-                            self.root.get_screen('Main').ids.current_talkgroup.text = str(current_talkgroup)
-                            self.add_log_entry(str(current_talkgroup))
+                        if int(current_talkgroup) in active_calls.talkgroups:
+                            # OP25 has no tags file, name the talkgroup from the system we imported
+                            tag = self.talkgroup_index.tag(config.get(section='RR', option='selected_system'),
+                                                           current_talkgroup)
+                            talkgroup_text = tag if tag else str(current_talkgroup)
+                            self.root.get_screen('Main').ids.current_talkgroup.text = talkgroup_text
+                            self.detailed_talkgroup = talkgroup_text
+                            self.add_log_entry(talkgroup_text)
                         else:
                             self.root.get_screen('Main').ids.current_talkgroup.text = "No Active Call"
                             self.detailed_talkgroup = "No Active Call"
@@ -715,25 +810,29 @@ class MainApp(MDApp):
         except Exception as e:
             print(f"Error updating large display: {e}")
 
-    def update_connection_status(self):
-        status = self.root.get_screen('Main').ids.connected_msg.text
-        # Update the SDR Info on Display
+    def update_sdr_info(self, *args):
+        # Called once at startup and again whenever an SDR setting is saved
         sdr = config.get(section='SDR', option='sdr')
         gain = str(config.get(section='SDR', option='gain'))
         sr = str(config.get(section='SDR', option='samplerate'))
-
         self.sdr_info = f"SDR: {sdr} | LNA: {gain} | SR: {sr}"
-        if self.op25client.connection_successful:
+
+    def on_local_config_change(self, section, option, value):
+        global TIME24
+        if option == 'time24':
+            TIME24 = config.get_bool(section='RCH', option='TIME24')
+        elif option in ('op25_ip', 'op25_port', 'mch_port'):
+            # Settings can move the app to another Pi without a restart
+            self.op25client.set_address(config.get(section='RCH', option='op25_ip'),
+                                        config.get(section='RCH', option='op25_port'),
+                                        config.get(section='RCH', option='mch_port'))
+
+    def update_connection_status(self, connected):
+        status = self.root.get_screen('Main').ids.connected_msg.text
+        if connected:
             if 'not connected' in status.lower():
                 self.root.get_screen('Main').ids.connected_msg.text = 'Connected to: OP25'
                 self.add_log_entry('Connected to: OP25')
-
-                # Update the SDR Info on Display
-                sdr = config.get(section='SDR', option='sdr')
-                gain = str(config.get(section='SDR', option='gain'))
-                sr = str(config.get(section='SDR', option='samplerate'))
-
-                self.sdr_info = f"SDR: {sdr} | LNA: {gain} | SR: {sr}"
         else:
             if 'Connected to: OP25' in status:
                 self.root.get_screen('Main').ids.connected_msg.text = 'Connecting...'
@@ -741,37 +840,27 @@ class MainApp(MDApp):
                 self.root.get_screen('Main').ids.connected_msg.text = 'Not Connected'
                 self.add_log_entry('OP25 Connection Lost')
 
-    def process_latest_values(self, latest_values):
-        Clock.schedule_once(lambda dt: self.update_signal_icon(latest_values))
-        Clock.schedule_once(lambda dt: self.update_large_display(latest_values))
-        Clock.schedule_once(lambda dt: self.update_detailed_display(latest_values))
-
-    def add_log_entry(self, text):
-        current_time = time.time()
-        # Check for duplication within 2 seconds
-        if self.last_log_entry == text and (current_time - self.last_log_time) < 2:
+    # Telemetry subscriber, called from the OP25Client poll thread with a frozen snapshot
+    @mainthread
+    def process_latest_values(self, snapshot):
+        if not self.is_active:
             return
+        latest_values = snapshot.values
+        changes = snapshot.changes
+        self.update_signal_icon(latest_values, changes)
+        self.update_large_display(latest_values, changes, snapshot.active_calls)
+        self.update_detailed_display(latest_values, changes)
+        self.update_connection_status(snapshot.connected)
 
-        log_box = self.root.get_screen('Main').ids.log_box
-        stamped_text = f'{current_time}: {text}'
-        new_label = Label(text=stamped_text, font_size='20sp', size_hint_y=None,
-                          height=self.calculate_text_height(stamped_text))
-        log_box.add_widget(new_label)
-
-        # Adjust the height of the log_box to accommodate the new entry
-        log_box.height = sum(child.height for child in log_box.children)
-        self.root.get_screen('Main').ids.log_scrollview.scroll_y = 1  # Scroll to the top
-
-        # Update the last log entry and timestamp
-        self.last_log_entry = text
-        self.last_log_time = current_time
+    def add_log_entry(self, text):
+        if self.activity_log.add(text) is not None:
+            self.log_view_refresh()
 
-    @staticmethod
-    def calculate_text_height(text):
-        # Calculate the height required for the text
-        label = Label(text=text)
-        label.texture_update()
-        return label.texture_size[1]
+    def refresh_log_view(self, *args):
+        # The RecycleView only builds widgets for visible rows, newest entry goes on top
+        log_view = self.root.get_screen('Main').ids.log_view
+        log_view.data = self.activity_log.view_data()
+        log_view.scroll_y = 1  # Scroll to the top
 
 
     def gps_zipcode(self):
@@ -789,86 +878,44 @@ class MainApp(MDApp):
 
 
     def load_zip_code_data(self):
-        with open('resources/uszips.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                self.zip_code_data.append({
-                    'zip': row['zip'],
-                    'lat': float(row['lat']),
-                    'lng': float(row['lng'])
-                })
+        # Memory maps the packed ZIP file (built from the CSV if it isn't there yet)
+        self.zip_index = ZipIndex.load('resources/uszips.csv', 'resources/uszips.bin')
 
     def find_nearest_zip_code(self, lat, lng):
-        nearest_zip = None
-        min_distance = float('inf')
-
-        for data in self.zip_code_data:
-            zip_lat = data['lat']
-            zip_lng = data['lng']
-            distance = self.calculate_distance(lat, lng, zip_lat, zip_lng)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_zip = data['zip']
-
-        return nearest_zip
-
-    def calculate_distance(self, lat1, lng1, lat2, lng2):
-        R = 6371.0  # Radius of the Earth in kilometers
-
-        lat1_rad = radians(lat1)
-        lng1_rad = radians(lng1)
-        lat2_rad = radians(lat2)
-        lng2_rad = radians(lng2)
-
-        dlng = lng2_rad - lng1_rad
-        dlat = lat2_rad - lat1_rad
-
-        a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlng / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        distance = R * c
-        return distance
-
-    # Function to calculate the distance between two GPS coordinates using Haversine formula
-    def haversine_distance(self, lat1, lon1, lat2, lon2):
-        # Convert latitude and longitude from degrees to radians
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        # Haversine formula
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        # Radius of Earth in kilometers. Use 3956 for miles
-        r = 6371
-        return r * c
-
-    # Function to find the nearest site in the SQLite database
-    def find_nearest_site(self, current_lat, current_lon):
-        system_id = config.get(section='RR', option='selected_system')
-        conn = sqlite3.connect(f'resources/systems/{system_id}.db')
-        cursor = conn.cursor()
-        # Query to get all site details
-        cursor.execute("SELECT site_id, latitude, longitude, site_county FROM sites")
-        sites = cursor.fetchall()
-        nearest_site = None
-        min_distance = float('inf')
-        for site in sites:
-            site_id, site_lat, site_lon, site_county = site
-            # Calculate the distance from current location
-            distance = self.haversine_distance(current_lat, current_lon, site_lat, site_lon)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_site = site
-        conn.close()
-        return nearest_site
+        # The ZIP data is only loaded the first time we actually need a location lookup
+        if self.zip_index is None:
+            try:
+                self.load_zip_code_data()
+            except OSError as e:
+                print(f"Unable to load ZIP code data: {e}")
+                return None
+        return self.zip_index.nearest(lat, lng)
 
     # More GPS Functions
+    def configure_gps(self):
+        # plyer is imported here, the first time GPS is started, rather than while the app loads
+        if self.gps_configured:
+            return True
+        try:
+            gps.configure(on_location=self.on_location,
+                          on_status=self.on_status)
+        except NotImplementedError:
+            import traceback
+            traceback.print_exc()
+            self.gps_status = 'GPS is not implemented for your platform'
+            return False
+        self.gps_configured = True
+        return True
+
     def start(self, minTime, minDistance):
+        if not self.configure_gps():
+            return
         gps.start(minTime, minDistance)
         self.gps_icon = "󰆣"
 
     def stop(self):
-        gps.stop()
+        if self.gps_configured:
+            gps.stop()
 
     @mainthread
     def on_location(self, **kwargs):
@@ -897,40 +944,59 @@ class MainApp(MDApp):
 
 
         if lat is not None and lon is not None:
-            nearest_zip = self.find_nearest_zip_code(lat, lon)
-            self.gps_icon = "󰆤"
-            self.root.get_screen('Main').ids.nearest_zip.text = f"Nearest ZIP: {nearest_zip}"
+            # A bad site row or ZIP record must not take down the app from this callback
             try:
+                nearest_zip = self.find_nearest_zip_code(lat, lon)
+                self.gps_icon = "󰆤"
+                self.root.get_screen('Main').ids.nearest_zip.text = f"Nearest ZIP: {nearest_zip}"
 
                 system_id = config.get(section='RR', option='selected_system')
 
-                nearest_site_name = self.find_nearest_site(lat, lon)[3]
-                nearest_site_id = self.find_nearest_site(lat, lon)[0]
-
-                # Check if the site id has changed
-                if nearest_site_id != self.previous_site_id:
-                    # Call your function
-                    self.op25client.send_cmd_to_op25(f'START_SYSTEM;{nearest_site_id};{system_id}')
-
-                    # Update the previous site id
-                    self.previous_site_id = nearest_site_id
-
-                self.root.get_screen('Main').ids.nearest_site.text = f"Nearest Site: {self.find_nearest_site(lat, lon)}"
-                self.root.get_screen('Main').ids.system_county.text = nearest_site_name
-
-            except:
-                print(f'DEBUG: No database')
+                # Work out the nearest site once per fix and share it with everything below
+                table = self.site_locator.sites_for(system_id)
+                nearest = table.nearest(lat, lon) if table is not None else None
+                if nearest is None:
+                    print(f'DEBUG: No database')
+                    return
+
+                # Ranking uses the decode history of this system's sites
+                self.site_quality.load(system_id)
+
+                # The switcher decides whether retuning is actually worth an OP25 restart
+                new_site = self.site_switcher.update(table, lat, lon, speed, bearing, accuracy)
+                if new_site is not None:
+                    self.op25client.send_cmd_to_op25_async(f'START_SYSTEM;{new_site.site_id};{system_id}')
+                    self.add_log_entry(f'Switching to site {new_site.site_id}: {new_site.site_county}')
+
+                self.root.get_screen('Main').ids.nearest_site.text = (
+                    f"Nearest Site: {tuple(nearest.site)} (avoided restarts: {self.site_switcher.avoided_restarts})")
+                self.root.get_screen('Main').ids.system_county.text = self.site_switcher.current_site.site_county
+            except Exception as e:
+                print(f'Error locating nearest site: {e}')
 
     @mainthread
     def on_status(self, stype, status):
         self.gps_status = 'type={}\n{}'.format(stype, status)
 
     def on_pause(self):
-        gps.stop()
+        self.stop()
+        self.site_quality.flush()
         return True
 
+    def on_stop(self):
+        # Don't lose a whitelist change that was still waiting for its push
+        if self.whitelist_push.is_triggered:
+            self.whitelist_push.cancel()
+            self.send_active_buttons_to_whitelist()
+        if self.scangrid is not None:
+            self.scangrid.close()
+        self.site_quality.flush()
+        self.activity_log.close()
+        self.call_history.close()
+
     def on_resume(self):
-        gps.start(1000, 0)
+        if self.gps_configured:
+            gps.start(1000, 0)
         pass
 
     # Go back to main screen
@@ -938,185 +1004,146 @@ class MainApp(MDApp):
         self.root.current = 'Main'
 
 
-    def send_active_buttons_to_whitelist(self):
-        db_file = 'resources/config/scangrid.db'
-
-        # Connect to the SQLite database
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
+    def send_active_buttons_to_whitelist(self, *args):
+        result = self.scangrid.whitelist()
+        # Toggling a button back and forth within the delay leaves nothing to send
+        if result == self.last_whitelist:
+            return
 
         try:
-            # Query to get all buttons in the "down" state
-            cursor.execute("SELECT text, tgid FROM buttons WHERE state = 'down'")
-
-            # Fetch all results
-            active_buttons = cursor.fetchall()
-
-            # Prepare a list to hold formatted strings
-            formatted_buttons = []
-
-            # Store text and tgid in variables
-            for button in active_buttons:
-                text, tgid = button
-                # Get the first line of text before \r\n
-                text = text.split('\r\n')[0]
-                # Append the formatted string to the list
-                formatted_buttons.append(f"{tgid}:{text}")
-
-            # Join the formatted strings with ';' and print the result
-            result = ";".join(formatted_buttons)
-
-            config = configparser.ConfigParser()
-            config.read('resources/config/config.ini')
-
-            try:
-                # Attempt to get the value as a string first
-                selected_system_str = config.get('RR', 'selected_system', fallback='0')
-                # Convert to integer, defaulting to 0 if the value is empty or invalid
-                selected_system = int(selected_system_str) if selected_system_str.strip() else 0
-            except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
-                selected_system = 0  # Default value if the section, key, or value is invalid
-
-
-            # NOTE: We need to send the selected system id too
-            self.op25client.send_cmd_to_op25(command=f'WRITE_WHITELIST;{selected_system};{result}')
-
-
-        finally:
-            # Ensure the connection is closed properly
-            conn.close()
-
-    def check_existance_of_scangrid_database(self):
-        # Check if the database file exists, if not, create it and create the table
-        db_file = 'resources/config/scangrid.db'
-        if not os.path.exists(db_file):
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE buttons (
-                    id TEXT PRIMARY KEY,
-                    state TEXT,
-                    text TEXT,
-                    tgid INTEGER
-                )
-            ''')
-            conn.commit()
-            conn.close()
-            self.check_button_states()
-
-    def check_button_states(self):
-        db_file = 'resources/config/scangrid.db'
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-
-        for i in range(1, 55):
-            button_id = f'button{i}'
-            button = self.root.get_screen('Main').ids.get(button_id)
-            if button:
-                state = 'down' if button.state == 'down' else 'normal'
-                # Check if the button already exists in the database
-                cursor.execute('SELECT id FROM buttons WHERE id = ?', (button_id,))
-                if cursor.fetchone():
-                    # Update existing button's state only
-                    cursor.execute('UPDATE buttons SET state = ? WHERE id = ?', (state, button_id))
-                else:
-                    # Insert new button with state and text
-                    text = button.text.strip()  # Get the original button text
-                    cursor.execute('INSERT INTO buttons (id, state, text, tgid) VALUES (?, ?, ?, ?)',
-                                   (button_id, state, text, 0))
-
-        conn.commit()
-        conn.close()
+            # Attempt to get the value as a string first
+            selected_system_str = config.get('RR', 'selected_system', fallback='0') or ''
+            # Convert to integer, defaulting to 0 if the value is empty or invalid
+            selected_system = int(selected_system_str) if selected_system_str.strip() else 0
+        except ValueError:
+            selected_system = 0  # Default value if the value is invalid
+
+        # NOTE: We need to send the selected system id too
+        self.op25client.send_cmd_to_op25_async(command=f'WRITE_WHITELIST;{selected_system};{result}')
+        self.last_whitelist = result
+
+    def ensure_scangrid(self):
+        # Read the buttons table once, buttons it doesn't know yet start out as "Button N"
+        if self.scangrid is None:
+            self.scangrid = ScanGridModel('resources/config/scangrid.db')
+            self.scangrid.seed(default_buttons(self.scangrid_bank_count()))
+        return self.scangrid
+
+    def scangrid_bank_count(self):
+        minimum = config.get_int(section='RCH', option='scangrid_banks', fallback=1) or 1
+        if self.scangrid is None:
+            return minimum
+        return self.scangrid.bank_count(minimum)
+
+    def switch_scangrid_bank(self, step):
+        self.scangrid_bank = (self.scangrid_bank + step) % self.scangrid_bank_count()
+        self.show_scangrid_bank(self.scangrid_bank)
+        if self.root.current == 'SettingsScanGridConfig':
+            self.show_scangrid_config()
+
+    def build_scangrid_bank(self, bank):
+        """Tabs of one bank, the widgets are created the first time the bank is shown."""
+        tabs = self.scangrid_bank_tabs.get(bank)
+        if tabs is not None:
+            return tabs
+        tabs = []
+        numbers = list(bank_button_numbers(bank))
+        for start in range(0, len(numbers), PAGE_SIZE):
+            page = numbers[start:start + PAGE_SIZE]
+            grid = GridLayout(cols=3, rows=4, spacing=10, padding=10)
+            for number in page:
+                button = Factory.ScanGridButton(button_id=button_id(number))
+                self.scangrid_widgets[button.button_id] = button
+                self.populate_scangrid_button(button)
+                grid.add_widget(button)
+            tab = TabbedPanelItem(text=f'{page[0]}-{page[-1]}')
+            tab.add_widget(grid)
+            tabs.append(tab)
+        self.scangrid_bank_tabs[bank] = tabs
+        return tabs
+
+    def show_scangrid_bank(self, bank):
+        screen = self.root.get_screen('Main')
+        panel = screen.ids.scangrid_tabs
+        tabs = self.build_scangrid_bank(bank)
+        panel.clear_tabs()
+        for tab in tabs:
+            panel.add_widget(tab)
+        panel.switch_to(tabs[0])
+        screen.ids.scangrid_bank_label.text = f'Bank {bank + 1} of {self.scangrid_bank_count()}'
+
+    def show_scangrid_config(self):
+        # Rows for the current bank, built on first visit and refreshed from the model every time
+        self.ensure_scangrid()
+        screen = self.root.get_screen('SettingsScanGridConfig')
+        rows = self.scangrid_config_rows.get(self.scangrid_bank)
+        if rows is None:
+            rows = [Factory.ScanGridConfigRow(number=number) for number in bank_button_numbers(self.scangrid_bank)]
+            self.scangrid_config_rows[self.scangrid_bank] = rows
+        container = screen.ids.scangrid_config_rows
+        container.clear_widgets()
+        for row in rows:
+            container.add_widget(row)
+        screen.ids.scangrid_config_bank_label.text = f'Bank {self.scangrid_bank + 1} of {self.scangrid_bank_count()}'
+        self.update_scangrid_config()
 
-        # Display the states in the console
-        for i in range(1, 55):
-            button_id = f'button{i}'
-            button = self.root.get_screen('Main').ids.get(button_id)
-            if button:
-                state = 'down' if button.state == 'down' else 'normal'
-                print(f'{button_id}: {state}')
+    def on_scangrid_toggle(self, button_id, state):
+        # Only the toggled button is written, the whitelist follows once toggling stops
+        if self.scangrid.set_state(button_id, 'down' if state == 'down' else 'normal'):
+            self.whitelist_push.cancel()
+            self.whitelist_push()
 
-        self.send_active_buttons_to_whitelist()
+    def search_talkgroups(self, query):
+        # Offer matching talkgroups of the selected system as the user types
+        system_id = config.get(section='RR', option='selected_system')
+        results = self.talkgroup_index.search(system_id, query)
+        spinner = self.root.get_screen('SettingsScanGridConfig').ids.talkgroup_search_results
+        spinner.values = [f"{talkgroup.tg_dec}: {talkgroup.tg_alpha}" for talkgroup in results]
+        spinner.text = f"{len(results)} matches" if query.strip() else "Search results"
+
+    def assign_talkgroup(self, selection, button):
+        match = re.match(r"^(\d+): (.*)$", selection)
+        if not match or not str(button).strip().isdigit():
+            print("Pick a talkgroup and a button number first.")
+            return
+        self.update_scangrid(match.group(1), match.group(2), int(button))
+        self.update_scangrid_config()
 
     def update_scangrid(self, dec, alpha, button):
-        db_file = 'resources/config/scangrid.db'
+        self.ensure_scangrid()
+        # Fill in the name of a talkgroup entered by number only
+        if not alpha.strip():
+            alpha = self.talkgroup_index.tag(config.get(section='RR', option='selected_system'), dec) or alpha
 
         # Convert button integer to the corresponding id in the database
-        button_id = f'button{button}'
-
-        # Connect to the SQLite database
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-
-        # Check if the tgid already exists for the given button_id
-        cursor.execute("SELECT tgid FROM buttons WHERE id = ?", (button_id,))
-        existing_tgid = cursor.fetchone()
-
-        if existing_tgid is None:
-            # If it doesn't exist, insert the new values
-            sql_insert_query = """INSERT INTO buttons (id, tgid, text) VALUES (?, ?, ?)"""
-            cursor.execute(sql_insert_query, (button_id, dec, alpha))  # Use 'alpha' directly for text
-        else:
-            # If it exists, update the values
-            sql_update_query = """UPDATE buttons SET tgid = ?, text = ? WHERE id = ?"""
-            cursor.execute(sql_update_query, (dec, alpha, button_id))  # Use 'alpha' directly for text
-
-        # Commit the changes and close the connection
-        conn.commit()
-        conn.close()
-
-        self.populate_scangrid()
-
-    def populate_scangrid(self):
-        db_file = 'resources/config/scangrid.db'
-
-        if not os.path.exists(db_file):
-            print("Database file does not exist.")
-            return
-
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, state, tgid, text FROM buttons')
-
-        for row in cursor.fetchall():
-            button_id, state, tgid, text = row
-            button = self.root.get_screen('Main').ids.get(button_id)
-            if button:
-                button.state = state
-                button.text = f"{text}\r\n{tgid}"
-
-        conn.close()
+        scan_button_id = button_id(button)
+        self.scangrid.assign(scan_button_id, dec, alpha)
+
+        # Only the assigned button changed, and it only has a widget if its bank has been shown
+        widget = self.scangrid_widgets.get(scan_button_id)
+        if widget is not None:
+            self.populate_scangrid_button(widget)
+        # An active button now means a different talkgroup
+        button_state = self.scangrid.get(scan_button_id)
+        if button_state is not None and button_state.state == 'down':
+            self.whitelist_push.cancel()
+            self.whitelist_push()
+
+    def populate_scangrid_button(self, button):
+        button_state = self.scangrid.get(button.button_id)
+        if button_state is not None:
+            button.state = button_state.state
+            button.text = f"{button_state.text}\r\n{button_state.tgid}"
 
     def update_scangrid_config(self):
-        db_file = 'resources/config/scangrid.db'
-
-        if not os.path.exists(db_file):
-            print("Database file does not exist.")
-            return
-
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, state, tgid, text FROM buttons')
-
-        # Fetch all results from the cursor
-        results = cursor.fetchall()
-
-        # Iterate through the results and update the textboxes
-        for row in results:
-            id, state, tgid, text = row
-            button_number = int(id.replace('button', ''))  # Extract the button number from the id
-
-            # Update the corresponding textboxes
-            if 1 <= button_number <= 54:  # Ensure the button number is within the valid range
-                self.root.get_screen('SettingsScanGridConfig').ids[f'scan_decimal_textbox{button_number}'].text = str(
-                    tgid)
-                self.root.get_screen('SettingsScanGridConfig').ids[f'scan_alpha_textbox{button_number}'].text = text
-
-        conn.close()
+        # Only the rows of the bank on screen exist, fill their textboxes from the model
+        for row in self.scangrid_config_rows.get(self.scangrid_bank, []):
+            button_state = self.scangrid.get(button_id(row.number))
+            if button_state is not None:
+                row.ids.decimal.text = str(button_state.tgid)
+                row.ids.alpha.text = button_state.text
 
 
 if __name__ == '__main__':
     app = MainApp()
     app.run()
-
-
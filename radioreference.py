@@ -1,11 +1,298 @@
-import zeep
 import base64
 import sqlite3
 import os
+import sys
 import csv
+import json
+import time
+import zlib
+import tempfile
+import threading
+from collections import namedtuple
+from lazyimport import LazyImport
+from responsecache import ResponseCache, cache_key
+
+# zeep pulls in lxml and requests, none of which is needed until the first SOAP call
+zeep = LazyImport('zeep')
+requests = LazyImport('requests')
+SqliteCache = LazyImport('zeep.cache', 'SqliteCache')
+serialize_object = LazyImport('zeep.helpers', 'serialize_object')
+Transport = LazyImport('zeep.transports', 'Transport')
+
+WSDL_URL = "http://api.radioreference.com/soap2/?wsdl&v=latest&s=rpc"
+# Downloaded WSDL/XSD documents are kept on disk so a new process doesn't refetch them
+WSDL_CACHE_PATH = 'resources/config/wsdl_cache.db'
+WSDL_CACHE_TIMEOUT = 30 * 24 * 3600
+SOAP_TIMEOUT = 30
+
+# Lookups are answered from this cache until they are older than their TTL in seconds
+RESPONSE_CACHE_PATH = 'resources/config/rr_cache.db'
+CACHE_TTLS = {
+    'getZipcodeInfo': 30 * 24 * 3600,
+    'getCountyInfo': 7 * 24 * 3600,
+    'getTrsSites': 24 * 3600,
+    'getTrsTalkgroups': 24 * 3600,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_response_cache = None
+
+
+def get_client(wsdl_url=WSDL_URL):
+    """Process wide zeep client, the WSDL is only parsed the first time it is asked for."""
+    with _clients_lock:
+        client = _clients.get(wsdl_url)
+        if client is None:
+            # One pooled session shared by every request made through this client
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            os.makedirs(os.path.dirname(WSDL_CACHE_PATH), exist_ok=True)
+            transport = Transport(session=session, cache=SqliteCache(path=WSDL_CACHE_PATH, timeout=WSDL_CACHE_TIMEOUT),
+                                  timeout=SOAP_TIMEOUT, operation_timeout=SOAP_TIMEOUT)
+            client = zeep.Client(wsdl=wsdl_url, transport=transport)
+            _clients[wsdl_url] = client
+        return client
+
+
+def get_response_cache():
+    """Process wide ResponseCache of RadioReference lookups, opened the first time it is asked for."""
+    global _response_cache
+    with _clients_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(RESPONSE_CACHE_PATH)
+        return _response_cache
+
+# Bumped whenever the layout of a system bundle changes
+BUNDLE_VERSION = 1
+
+
+SITES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sites (
+    site_id INTEGER PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    site_county TEXT,
+    rfss INTEGER,
+    site_number TEXT
+)
+'''
+
+TALKGROUPS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS talkgroups (
+    tg_dec INTEGER PRIMARY KEY,
+    tg_alpha TEXT
+)
+'''
+
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS sites_rfss_site_number ON sites (rfss, site_number)',
+)
+
+
+def site_field(site, name, default=None):
+    # Works for both zeep response objects and the plain dicts of a bundle
+    try:
+        value = site[name]
+    except (KeyError, IndexError, TypeError):
+        return default
+    return default if value is None else value
+
+
+def site_row(site):
+    return (
+        site['siteId'],
+        float(site['lat']),  # Convert to float
+        float(site['lon']),  # Convert to float
+        site['siteDescr'],
+        # RFSS and site number let us match OP25's rfid/stid back to a site
+        site_field(site, 'rfss'),
+        site_field(site, 'siteNumber'),
+    )
+
+
+def plain_site(site):
+    """Copy the fields we use out of a getTrsSites result into JSON friendly types."""
+    return {
+        'siteId': site['siteId'],
+        'siteNumber': site_field(site, 'siteNumber'),
+        'rfss': site_field(site, 'rfss'),
+        'siteDescr': site['siteDescr'],
+        'lat': str(site['lat']),
+        'lon': str(site['lon']),
+        'siteFreqs': [{'freq': str(freq['freq']), 'use': site_field(freq, 'use'), 'lcn': site_field(freq, 'lcn')}
+                      for freq in (site_field(site, 'siteFreqs') or [])],
+    }
+
+
+def encode_bundle(bundle):
+    """Pack a system bundle into a single line of text safe to send in a command."""
+    raw = json.dumps(bundle, separators=(',', ':')).encode()
+    return base64.b64encode(zlib.compress(raw, 9)).decode()
+
+
+def decode_bundle(payload):
+    bundle = json.loads(zlib.decompress(base64.b64decode(payload)))
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported system bundle version {bundle.get('version')}")
+    return bundle
+
+
+# The mchserver reads a command with a single 1024 byte recv, so bundles are sent as
+# IMPORT_SYSTEM;{system_id};{index};{count};{chunk} commands that each fit in one
+BUNDLE_CHUNK_SIZE = 768
+
+
+def bundle_chunks(bundle, size=BUNDLE_CHUNK_SIZE):
+    payload = encode_bundle(bundle)
+    return [payload[start:start + size] for start in range(0, len(payload), size)]
+
+
+class BundleReceiver:
+    """Pi side of IMPORT_SYSTEM, puts the chunks of each system's bundle back together."""
+
+    def __init__(self):
+        self.parts = {}
+
+    def add(self, system_id, index, count, chunk):
+        """Store a chunk, returns the whole payload once every chunk has arrived, else None."""
+        index = int(index)
+        count = int(count)
+        # A first chunk starts the bundle over, dropping anything left from an import that broke off
+        if index == 0:
+            self.parts[system_id] = {}
+        parts = self.parts.setdefault(system_id, {})
+        parts[index] = chunk
+        if len(parts) < count:
+            return None
+        del self.parts[system_id]
+        return ''.join(parts[position] for position in range(count))
+
+
+def import_system_bundle(payload):
+    """Pi side of IMPORT_SYSTEM, builds the trunk files and database from a phone's bundle."""
+    bundle = decode_bundle(payload)
+    changes = GetSystems.write_system_files(bundle)
+    print(f"Imported system {bundle['system_id']}: {describe_changes(changes)}")
+    return bundle['system_id']
+
+
+TRUNK_HEADER = [
+    "Sysname", "Control Channel List", "Offset", "NAC", "Modulation", "TGID Tags File", "Whitelist",
+    "Blacklist", "Center Frequency"
+]
+
+# Which control channels go first in a trunk file, 'a' (alternate) or 'd' (primary) use codes
+CONTROL_CHANNEL_USES = {'alternate': 'a', 'primary': 'd'}
+DEFAULT_CONTROL_CHANNEL_ORDER = 'alternate'
+
+
+def control_channels(site_freqs, order=DEFAULT_CONTROL_CHANNEL_ORDER, by_lcn=False):
+    """Control channel frequencies of a site, the ones used as the preferred kind first.
+
+    Roles are worked out in one pass over siteFreqs, so without by_lcn this is
+    linear. Within each group frequencies keep RadioReference's order, or are
+    sorted by LCN when by_lcn is set (frequencies without an LCN go last).
+    """
+    preferred_use = CONTROL_CHANNEL_USES[order]
+    # A frequency listed with the preferred use anywhere counts as preferred everywhere
+    preferred_freqs = {freq['freq'] for freq in site_freqs if freq['use'] == preferred_use}
+    preferred = []
+    others = []
+    for freq in site_freqs:
+        if freq['use'] is None:
+            continue
+        group = preferred if freq['freq'] in preferred_freqs else others
+        group.append(freq)
+
+    if by_lcn:
+        def lcn_key(freq):
+            lcn = site_field(freq, 'lcn')
+            return (lcn is None, lcn if lcn is not None else 0)
+        preferred.sort(key=lcn_key)
+        others.sort(key=lcn_key)
+    return [freq['freq'] for freq in preferred] + [freq['freq'] for freq in others]
+
+
+def add_missing_columns(cursor, table, columns):
+    # Databases from older imports predate some columns, add them in place
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    for name, column_type in columns:
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+TalkgroupChanges = namedtuple('TalkgroupChanges', ['added', 'updated', 'removed'])
+
+
+def sync_talkgroups(cursor, talkgroups_info):
+    """Bring the talkgroups table in line with a fresh list, touching only the rows that changed."""
+    cursor.execute(TALKGROUPS_SCHEMA)
+    existing = dict(cursor.execute('SELECT tg_dec, tg_alpha FROM talkgroups'))
+    fresh = {int(talkgroup[0]): talkgroup[1] for talkgroup in talkgroups_info}
+
+    added = [(tg_dec, tg_alpha) for tg_dec, tg_alpha in fresh.items() if tg_dec not in existing]
+    updated = [(tg_alpha, tg_dec) for tg_dec, tg_alpha in fresh.items()
+               if tg_dec in existing and existing[tg_dec] != tg_alpha]
+    removed = [(tg_dec,) for tg_dec in existing if tg_dec not in fresh]
+
+    cursor.executemany('INSERT INTO talkgroups (tg_dec, tg_alpha) VALUES (?, ?)', added)
+    cursor.executemany('UPDATE talkgroups SET tg_alpha = ? WHERE tg_dec = ?', updated)
+    cursor.executemany('DELETE FROM talkgroups WHERE tg_dec = ?', removed)
+    return TalkgroupChanges(sorted(row[0] for row in added), sorted(row[1] for row in updated),
+                            sorted(row[0] for row in removed))
+
+
+def describe_changes(changes):
+    # None means no talkgroup sync ran, usually because the talkgroup download failed
+    if changes is None:
+        return "no talkgroups downloaded"
+    if not (changes.added or changes.updated or changes.removed):
+        return "talkgroups unchanged"
+    return f"{len(changes.added)} talkgroups added, {len(changes.updated)} renamed, {len(changes.removed)} removed"
+
+
+def write_system_database(db_path, sites_info=(), talkgroups_info=None):
+    """Bulk load sites (and optionally talkgroups) into a system database in one transaction.
+
+    Sites missing from a non-empty sites_info are deleted. Talkgroups are
+    synced against what the database already has, the TalkgroupChanges are
+    returned (None when no talkgroups were given).
+    """
+    changes = None
+    conn = sqlite3.connect(db_path)
+    try:
+        # These files get copied to the Pi, so keep them in rollback journal mode with no -wal/-shm
+        # sidecars. This also checkpoints and converts databases written in WAL mode by older imports
+        conn.execute('PRAGMA journal_mode=DELETE')
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(SITES_SCHEMA)
+            add_missing_columns(cursor, 'sites', (('rfss', 'INTEGER'), ('site_number', 'TEXT')))
+            rows = [site_row(site) for site in sites_info]
+            cursor.executemany('''
+            INSERT OR REPLACE INTO sites (site_id, latitude, longitude, site_county, rfss, site_number)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            if rows:
+                # Sites RadioReference no longer lists are dropped, the way removed talkgroups are
+                fresh = {int(row[0]) for row in rows}
+                stale = [(site_id,) for (site_id,) in cursor.execute('SELECT site_id FROM sites') if site_id not in fresh]
+                cursor.executemany('DELETE FROM sites WHERE site_id = ?', stale)
+
+            if talkgroups_info is not None:
+                changes = sync_talkgroups(cursor, talkgroups_info)
+
+            for index in INDEXES:
+                cursor.execute(index)
+    finally:
+        conn.close()
+    return changes
 
 class GetSystems:
-    def __init__(self, username, password, version="latest", style="rpc"):
+    def __init__(self, username, password, version="latest", style="rpc", cache=None, ttls=None, soap_client=None):
         self.auth_info = {
             "appKey": base64.b64decode('Mjg4MDExNjM=').decode(),
             "username": username,
@@ -13,21 +300,37 @@ class GetSystems:
             "version": version,
             "style": style
         }
-        self.wsdl_url = "http://api.radioreference.com/soap2/?wsdl&v=latest&s=rpc"
-        self.client = zeep.Client(wsdl=self.wsdl_url)
+        self.wsdl_url = WSDL_URL
+        self.cache = cache
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.soap_client = soap_client
+
+    @property
+    def client(self):
+        # Built on first use and shared with every other GetSystems instance
+        if self.soap_client is not None:
+            return self.soap_client
+        return get_client(self.wsdl_url)
+
+    def cached(self, method, args, fetch, refresh=False):
+        # Cached responses are plain dicts/lists, so they look the same whether fresh or not
+        cache = self.cache if self.cache is not None else get_response_cache()
+        # A refresh still falls back to the cached copy if RadioReference can't be reached
+        ttl = 0 if refresh else self.ttls.get(method, 0)
+        return cache.get_or_fetch(cache_key(method, args), ttl, fetch)
 
     def get_zipcode_info(self, zip_code):
         try:
-            response = self.client.service.getZipcodeInfo(zipcode=int(zip_code), authInfo=self.auth_info)
-            return response
+            return self.cached('getZipcodeInfo', (int(zip_code),), lambda: serialize_object(
+                self.client.service.getZipcodeInfo(zipcode=int(zip_code), authInfo=self.auth_info)))
         except Exception as e:
             print(f"An error occurred: {e}")
             return None
 
     def get_county_info(self, county_id):
         try:
-            response = self.client.service.getCountyInfo(ctid=county_id, authInfo=self.auth_info)
-            return response
+            return self.cached('getCountyInfo', (county_id,), lambda: serialize_object(
+                self.client.service.getCountyInfo(ctid=county_id, authInfo=self.auth_info)))
         except Exception as e:
             print(f"An error occurred while fetching county information: {e}")
             return None
@@ -35,54 +338,59 @@ class GetSystems:
 
 
 
-    def create_system_database(self, system_id):
-        try:
-            response = self.client.service.getTrsSites(sid=system_id, authInfo=self.auth_info)
-
-            if response:
-                # Create directory if it doesn't exist
-                db_directory = os.path.join('resources', 'systems')
-                os.makedirs(db_directory, exist_ok=True)
-
-                # Create or connect to the SQLite database named after the system_id
-                db_path = os.path.join(db_directory, f"{system_id}.db")
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-
-                # Create table if it doesn't exist
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sites (
-                    site_id INTEGER PRIMARY KEY,
-                    latitude REAL,
-                    longitude REAL,
-                    site_county TEXT
-                )
-                ''')
-
-                # Insert data into the table
-                for site in response:
-                    cursor.execute('''
-                    INSERT INTO sites (site_id, latitude, longitude, site_county)
-                    VALUES (?, ?, ?, ?)
-                    ''', (
-                        site['siteId'],
-                        float(site['lat']),  # Convert to float
-                        float(site['lon']),  # Convert to float
-                        site['siteDescr']
-                    ))
-
-                # Commit the changes and close the connection
-                conn.commit()
-                conn.close()
-
-                print(f"Data has been stored in {db_path}")
-            else:
-                print("No sites found for this trunked system.")
+    def create_system_database(self, system_id, bundle=None):
+        """Store a system's sites, and the talkgroups of a bundle, on the phone.
 
-        except sqlite3.Error as sqle:
-            print(f"SQLite error: {sqle}")
-        except Exception as e:
-            print(f"An error occurred while fetching and storing trunked system sites: {e}")
+        Returns the TalkgroupChanges, None if there were no talkgroups to sync or
+        no sites to store. Errors writing the database are raised to the caller.
+        """
+        # Reuse the sites of an already fetched bundle instead of asking RadioReference again
+        talkgroups_info = None
+        if bundle is not None:
+            response = bundle['sites']
+            # An empty list means the talkgroup download failed, don't sync that into the database
+            talkgroups_info = bundle['talkgroups'] or None
+        else:
+            response = self.get_trs_sites(system_id)
+
+        if not response:
+            print("No sites found for this trunked system.")
+            return None
+
+        # Create directory if it doesn't exist
+        db_directory = os.path.join('resources', 'systems')
+        os.makedirs(db_directory, exist_ok=True)
+
+        # Create or connect to the SQLite database named after the system_id
+        db_path = os.path.join(db_directory, f"{system_id}.db")
+        changes = write_system_database(db_path, response, talkgroups_info)
+
+        print(f"Data has been stored in {db_path}")
+        return changes
+
+    def fetch_system_bundle(self, system_id, progress=None, refresh=False):
+        """Fetch everything needed to set up a system with one call per dataset.
+
+        progress, if given, is called with a short status string as each step starts.
+        refresh skips the response cache. Returns None if RadioReference has no sites for the system.
+        """
+        if progress:
+            progress(f"Fetching sites for system {system_id}")
+        sites_info = self.get_trs_sites(system_id, refresh)
+        if not sites_info:
+            print("No sites found for this trunked system.")
+            return None
+
+        if progress:
+            progress(f"Fetching talkgroups for system {system_id}")
+        talkgroups_info = self.get_trs_talkgroups(system_id, refresh) or []
+
+        return {
+            'version': BUNDLE_VERSION,
+            'system_id': str(system_id),
+            'sites': [plain_site(site) for site in sites_info],
+            'talkgroups': [[int(talkgroup[0]), talkgroup[1]] for talkgroup in talkgroups_info],
+        }
 
     def get_systems_in_county(self, zip_code):
         zipcode_info = self.get_zipcode_info(zip_code)
@@ -99,16 +407,16 @@ class GetSystems:
             return []
 
 
-    def get_trs_sites(self, system_id):
+    def get_trs_sites(self, system_id, refresh=False):
         try:
-            response = self.client.service.getTrsSites(sid=system_id, authInfo=self.auth_info)
-            return response
+            return self.cached('getTrsSites', (str(system_id),), lambda: serialize_object(
+                self.client.service.getTrsSites(sid=system_id, authInfo=self.auth_info)), refresh)
         except Exception as e:
             print(f"An error occurred while fetching trunked system sites: {e}")
             return None
 
-    def get_trs_talkgroups(self, system_id):
-        try:
+    def get_trs_talkgroups(self, system_id, refresh=False):
+        def fetch():
             result = self.client.service.getTrsTalkgroups(system_id, 0, 0, 0, self.auth_info)
             talkgroups_info = []
             for row in result:
@@ -117,11 +425,15 @@ class GetSystems:
                 else:
                     pass
             return talkgroups_info
+
+        try:
+            return self.cached('getTrsTalkgroups', (str(system_id),), fetch, refresh)
         except Exception as e:
             print(f"An error occurred while fetching trunked system talkgroups: {e}")
             return None
 
-    def create_system_folder(self, system_id):
+    @staticmethod
+    def create_system_folder(system_id):
         if not os.path.exists('systems'):
             os.makedirs('systems')
         system_folder = os.path.join('systems', str(system_id))
@@ -129,127 +441,185 @@ class GetSystems:
             os.makedirs(system_folder)
         return system_folder
 
-    def create_talkgroups_tsv_file(self, system_id, talkgroups):
-        system_folder = self.create_system_folder(system_id)
+    @staticmethod
+    def create_talkgroups_tsv_file(system_id, talkgroups):
+        system_folder = GetSystems.create_system_folder(system_id)
         file_path = os.path.join(system_folder, f"{system_id}_talkgroups.tsv")
         with open(file_path, 'w', newline='') as tsvfile:
             writer = csv.writer(tsvfile, delimiter='\t')
             for talkgroup in talkgroups:
                 writer.writerow(talkgroup)
 
-        # Create whitelist and blacklist
-        whitelist_file_path = os.path.join(system_folder, f"{system_id}_whitelist.tsv")
-        blacklist_file_path = os.path.join(system_folder, f"{system_id}_blacklist.tsv")
+        # Create whitelist and blacklist, existing ones hold the user's edits and are left alone
+        for list_name in ('whitelist', 'blacklist'):
+            list_file_path = os.path.join(system_folder, f"{system_id}_{list_name}.tsv")
+            if not os.path.exists(list_file_path):
+                with open(list_file_path, 'w') as list_file:
+                    list_file.write('')
+
+    @staticmethod
+    def create_site_tsv_file(system_id, site, order=DEFAULT_CONTROL_CHANNEL_ORDER, by_lcn=False):
+        GetSystems.create_site_tsv_files(system_id, [site], order, by_lcn)
+
+    @staticmethod
+    def create_site_tsv_files(system_id, sites, order=DEFAULT_CONTROL_CHANNEL_ORDER, by_lcn=False):
+        """Write the trunk TSV of every site in one pass, returns the site ids written."""
+        system_folder = GetSystems.create_system_folder(system_id)
+        # Everything but the control channel list is the same for every site of a system
+        row_prefix = [f"{system_id}"]
+        row_suffix = ["0", "0", "cqpsk", f"systems/{system_id}/{system_id}_talkgroups.tsv",
+                      f"systems/{system_id}/{system_id}_whitelist.tsv", f"systems/{system_id}/{system_id}_blacklist.tsv", ""]
+        written = []
+        for site in sites:
+            site_id = site['siteId']
+            file_path = os.path.join(system_folder, f"{system_id}_{site_id}_trunk.tsv")
+            channels = control_channels(site_field(site, 'siteFreqs') or [], order, by_lcn)
+            with open(file_path, 'w', newline='') as tsvfile:
+                writer = csv.writer(tsvfile, delimiter='\t', quoting=csv.QUOTE_ALL)
+                writer.writerow(TRUNK_HEADER)
+                writer.writerow(row_prefix + [','.join(map(str, channels))] + row_suffix)
+            written.append(site_id)
+        return written
+
+    @staticmethod
+    def create_and_populate_db(system_id, sites_info, talkgroups_info):
+        system_folder = GetSystems.create_system_folder(system_id)
+        db_path = os.path.join(system_folder, f"{system_id}.db")
+        return write_system_database(db_path, sites_info, talkgroups_info)
 
-        with open(whitelist_file_path, 'w') as whitelist_file:
-            whitelist_file.write('')
 
-        with open(blacklist_file_path, 'w') as blacklist_file:
-            blacklist_file.write('')
 
-    def create_site_tsv_file(self, system_id, site):
-        system_folder = self.create_system_folder(system_id)
-        site_id = site['siteId']
-        file_path = os.path.join(system_folder, f"{system_id}_{site_id}_trunk.tsv")
+    def create_system_tsv_files(self, system_id, bundle=None):
+        # Only go to RadioReference when we weren't handed a bundle
+        if bundle is None:
+            bundle = self.fetch_system_bundle(system_id)
+        if bundle is None:
+            print("No data available to store in the database.")
+            return
+        self.write_system_files(bundle)
 
+    @staticmethod
+    def write_system_files(bundle):
+        system_id = bundle['system_id']
+        sites_info = bundle['sites']
+        talkgroups_info = bundle['talkgroups']
 
+        site_ids = GetSystems.create_site_tsv_files(system_id, sites_info)
+        print(f"Created TSV files for {len(site_ids)} sites")
+
+        # Create and populate the database, talkgroups only get the rows that changed
+        changes = GetSystems.create_and_populate_db(system_id, sites_info, talkgroups_info or None)
+        print(f"Data has been stored in {os.path.join('systems', str(system_id), f'{system_id}.db')}")
+
+        if talkgroups_info:
+            tags_path = os.path.join('systems', str(system_id), f"{system_id}_talkgroups.tsv")
+            if changes.added or changes.updated or changes.removed or not os.path.exists(tags_path):
+                GetSystems.create_talkgroups_tsv_file(system_id, talkgroups_info)
+                print(f"Created TSV file for talkgroups of system {system_id}, {describe_changes(changes)}.")
+            else:
+                print(f"Talkgroups of system {system_id} are up to date.")
+        else:
+            print("No talkgroup data found for this trunked system.")
+        return changes
 
-        control_channels = sorted(
-            [freq['freq'] for freq in site['siteFreqs'] if freq['use'] is not None],
-            key=lambda freq: (1 if any(f['use'] == 'a' and f['freq'] == freq for f in site['siteFreqs']) else 2)
-        )
-        control_channels_str = ','.join(map(str, control_channels))
-        with open(file_path, 'w', newline='') as tsvfile:
-            writer = csv.writer(tsvfile, delimiter='\t', quoting=csv.QUOTE_ALL)
-            writer.writerow([
-                "Sysname", "Control Channel List", "Offset", "NAC", "Modulation", "TGID Tags File", "Whitelist",
-                "Blacklist", "Center Frequency"
-            ])
-            writer.writerow([
-                f"{system_id}", f"{control_channels_str}", "0", "0", "cqpsk", f"systems/{system_id}/{system_id}_talkgroups.tsv", f"systems/{system_id}/{system_id}_whitelist.tsv", f"systems/{system_id}/{system_id}_blacklist.tsv", ""
-            ])
-
-    def create_and_populate_db(self, system_id, sites_info, talkgroups_info):
-        system_folder = self.create_system_folder(system_id)
-        db_path = os.path.join(system_folder, f"{system_id}.db")
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Create tables if they don't exist
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sites (
-            site_id INTEGER PRIMARY KEY,
-            latitude REAL,
-            longitude REAL,
-            site_county TEXT
-        )
-        ''')
 
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS talkgroups (
-            tg_dec INTEGER PRIMARY KEY,
-            tg_alpha TEXT
-        )
-        ''')
-
-        # Insert site data
-        for site in sites_info:
-            cursor.execute('''
-            INSERT OR IGNORE INTO sites (site_id, latitude, longitude, site_county)
-            VALUES (?, ?, ?, ?)
-            ''', (
-                site['siteId'],
-                float(site['lat']),  # Convert to float
-                float(site['lon']),  # Convert to float
-                site['siteDescr']
-            ))
-
-        # Insert talkgroup data
-        for talkgroup in talkgroups_info:
-            cursor.execute('''
-            INSERT OR IGNORE INTO talkgroups (tg_dec, tg_alpha)
-            VALUES (?, ?)
-            ''', (
-                talkgroup[0],
-                talkgroup[1]
-            ))
-
-        # Commit the changes and close the connection
-        conn.commit()
-        conn.close()
 
+def benchmark_import(directory=None, talkgroup_count=3000, site_count=30, repeats=5):
+    """Time what the app writes on import against the old row at a time inserts.
 
+    Each run imports a synthetic system into a fresh database and then imports
+    it again, the way a refresh from RadioReference does. The median of the
+    runs is reported. Run it with a directory on the phone or the Pi's SD card
+    to see real storage.
+    """
+    sites_info = [{'siteId': i, 'lat': 40 + i / 1000, 'lon': -82 - i / 1000, 'siteDescr': f'Site {i}'}
+                  for i in range(1, site_count + 1)]
+    talkgroups_info = [[i, f'Talkgroup {i}'] for i in range(1, talkgroup_count + 1)]
 
-    def create_system_tsv_files(self, system_id):
-        # Fetch and save site data
-        sites_info = self.get_trs_sites(system_id)
-        if sites_info:
+    def row_at_a_time(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(SITES_SCHEMA)
+            cursor.execute(TALKGROUPS_SCHEMA)
             for site in sites_info:
-                self.create_site_tsv_file(system_id, site)
-                print(f"Created TSV file for site {site['siteId']}")
-        else:
-            print("No sites found for this trunked system.")
+                cursor.execute('INSERT OR REPLACE INTO sites (site_id, latitude, longitude, site_county) '
+                               'VALUES (?, ?, ?, ?)',
+                               (site['siteId'], float(site['lat']), float(site['lon']), site['siteDescr']))
+            for talkgroup in talkgroups_info:
+                cursor.execute('INSERT OR REPLACE INTO talkgroups (tg_dec, tg_alpha) VALUES (?, ?)',
+                               (talkgroup[0], talkgroup[1]))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def bulk(db_path):
+        write_system_database(db_path, sites_info, talkgroups_info)
+
+    print(f"{site_count} sites, {talkgroup_count} talkgroups, median of {repeats} runs")
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        for label, write in (('row at a time', row_at_a_time), ('bulk import', bulk)):
+            first_times = []
+            again_times = []
+            for run in range(repeats):
+                db_path = os.path.join(directory, f'{label.replace(" ", "_")}{run}.db')
+                start = time.perf_counter()
+                write(db_path)
+                first_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                write(db_path)
+                again_times.append(time.perf_counter() - start)
+            first_times.sort()
+            again_times.sort()
+            print(f"{label:<14} first import {first_times[repeats // 2] * 1000:6.1f} ms, "
+                  f"re-import {again_times[repeats // 2] * 1000:6.1f} ms")
+
+
+def benchmark_trunk_files(site_count=300, freq_count=60):
+    """Time writing the trunk TSVs of a synthetic system against the old per frequency rescan."""
+    uses = ('a', 'd', None)
+    sites_info = [{'siteId': i, 'siteFreqs': [{'freq': f'{851 + j / 80:.5f}', 'use': uses[j % 3], 'lcn': j}
+                                              for j in range(freq_count)]}
+                  for i in range(1, site_count + 1)]
+
+    start = time.perf_counter()
+    for site in sites_info:
+        sorted(
+            [freq['freq'] for freq in site['siteFreqs'] if freq['use'] is not None],
+            key=lambda freq: (1 if any(f['use'] == 'a' and f['freq'] == freq for f in site['siteFreqs']) else 2)
+        )
+    legacy_time = time.perf_counter() - start
 
-        # Fetch and save talkgroup data
-        talkgroups_info = self.get_trs_talkgroups(system_id)
-        if talkgroups_info:
-            self.create_talkgroups_tsv_file(system_id, talkgroups_info)
-            print(f"Created TSV file for talkgroups of system {system_id}.")
-        else:
-            print("No talkgroup data found for this trunked system.")
+    start = time.perf_counter()
+    for site in sites_info:
+        control_channels(site['siteFreqs'])
+    ordering_time = time.perf_counter() - start
 
-        # Create and populate the database
-        if sites_info or talkgroups_info:
-            self.create_and_populate_db(system_id, sites_info if sites_info else [],
-                                   talkgroups_info if talkgroups_info else [])
-            print(f"Data has been stored in {os.path.join('systems', str(system_id), f'{system_id}.db')}")
-        else:
-            print("No data available to store in the database.")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            start = time.perf_counter()
+            GetSystems.create_site_tsv_files('1', sites_info)
+            writer_time = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
 
+    print(f"{site_count} sites, {freq_count} frequencies each")
+    print(f"old ordering:      {legacy_time * 1000:.1f} ms")
+    print(f"new ordering:      {ordering_time * 1000:.1f} ms")
+    print(f"writing all files: {writer_time * 1000:.1f} ms")
 
 
+# python radioreference.py benchmark [directory]   time the database import on a synthetic system
+# python radioreference.py benchmark-trunk [sites] [frequencies]   time trunk file generation
 # Example usage:
-if __name__ == "__main__":
+if __name__ == "__main__" and sys.argv[1:2] == ['benchmark']:
+    benchmark_import(sys.argv[2] if len(sys.argv) > 2 else None)
+elif __name__ == "__main__" and sys.argv[1:2] == ['benchmark-trunk']:
+    benchmark_trunk_files(int(sys.argv[2]) if len(sys.argv) > 2 else 300,
+                          int(sys.argv[3]) if len(sys.argv) > 3 else 60)
+elif __name__ == "__main__":
     username = ""
     password = ""
 
@@ -1,18 +1,53 @@
 # config_parser.py
 
 import configparser
+import io
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# One Configure per file, shared by every module that asks for it
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_config(config_file, required=True):
+    """Return the process wide Configure for config_file, loading it the first time."""
+    key = os.path.abspath(config_file)
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = Configure(config_file, required)
+        return _instances[key]
+
 
 class Configure:
-    def __init__(self, config_file):
+    """Keeps a configuration file in memory.
+
+    Reads never touch the disk. A set() saves straight away unless it is made
+    inside batch(), which saves once when the outermost batch ends and throws
+    the batch's changes away if its body raises. Saves write a temporary file
+    and rename it over the old one, so a crash mid-save never leaves a half
+    written file. Callbacks registered with subscribe() hear about every value
+    that actually changed, after the lock has been released.
+    """
+
+    def __init__(self, config_file, required=True):
         self.config = configparser.ConfigParser()
         self.config_file = config_file
+        self.required = required
+        self.lock = threading.RLock()
+        self.batch_depth = 0
+        self.pending = []
+        self.subscribers = []
         self.load_config()
 
     def load_config(self):
         """Load the configuration file."""
         if not os.path.exists(self.config_file):
-            raise FileNotFoundError(f"Configuration file '{self.config_file}' not found.")
+            if self.required:
+                raise FileNotFoundError(f"Configuration file '{self.config_file}' not found.")
+            return
         self.config.read(self.config_file)
 
     def get(self, section, option, fallback=None):
@@ -43,16 +78,103 @@ class Configure:
         except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
             return fallback
 
+    def has_section(self, section):
+        return self.config.has_section(section)
+
+    def subscribe(self, callback, section=None):
+        """Call callback(section, option, value) after a value changes, only for section if given."""
+        with self.lock:
+            self.subscribers.append((section, callback))
+
     def set(self, section, option, value):
-        """Set a value in the configuration file."""
-        if not self.config.has_section(section):
-            self.config.add_section(section)
-        self.config.set(section, option, str(value))
+        """Set a value, saved now or when the surrounding batch() ends."""
+        changes = []
+        with self.lock:
+            option = self.config.optionxform(option)
+            value = str(value)
+            if self.get(section, option) == value:
+                return
+            if not self.config.has_section(section):
+                self.config.add_section(section)
+            self.config.set(section, option, value)
+            self.pending.append((section, option, value))
+            if self.batch_depth == 0:
+                changes = self.commit()
+        self.notify(changes)
+
+    @contextmanager
+    def batch(self):
+        """Group several set() calls into one save and one round of notifications.
+
+        If the body raises, every value it set is put back and nothing is saved.
+        """
+        changes = []
+        with self.lock:
+            saved_config = self.dump()
+            saved_pending = len(self.pending)
+            self.batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.batch_depth -= 1
+                self.restore(saved_config)
+                del self.pending[saved_pending:]
+                raise
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                changes = self.commit()
+        self.notify(changes)
+
+    def dump(self):
+        text = io.StringIO()
+        self.config.write(text)
+        return text.getvalue()
+
+    def restore(self, text):
+        config = configparser.ConfigParser()
+        config.read_string(text)
+        self.config = config
+
+    def commit(self):
+        """Save pending changes, returns them for notify(). Called with the lock held."""
+        if not self.pending:
+            return []
+        changes, self.pending = self.pending, []
         self.save_config()
+        return changes
+
+    def notify(self, changes):
+        # Runs without the lock, a subscriber may use the config from any thread
+        if not changes:
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for section, option, value in changes:
+            for wanted, callback in subscribers:
+                if wanted is None or wanted == section:
+                    try:
+                        callback(section, option, value)
+                    except Exception as e:
+                        print(f"Error notifying config change {section}.{option}: {e}")
 
     def save_config(self):
         """Save the configuration to the file."""
-        with open(self.config_file, 'w') as configfile:
-            self.config.write(configfile)
+        directory = os.path.dirname(self.config_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.config-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as configfile:
+                    self.config.write(configfile)
+                    configfile.flush()
+                    os.fsync(configfile.fileno())
+                # mkstemp creates the file readable by us only, keep the permissions the old file had
+                if os.path.exists(self.config_file):
+                    os.chmod(temp_path, os.stat(self.config_file).st_mode & 0o777)
+                os.replace(temp_path, self.config_file)
+            except OSError as e:
+                print(f"Error saving {self.config_file}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
 
 # End of config_parser.py
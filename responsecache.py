@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from collections import namedtuple
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'stored_at'])
+
+# Entries kept before the least recently used ones are evicted
+DEFAULT_MAX_ENTRIES = 500
+
+
+def cache_key(method, args):
+    return f"{method}:{json.dumps(list(args), sort_keys=True, default=str)}"
+
+
+class ResponseCache:
+    """Persistent LRU cache of API responses.
+
+    Values are pickled into a small SQLite table with the time they were stored
+    and last used. Expiry is decided by the caller through get_or_fetch, which
+    serves fresh entries directly, refreshes stale ones, and falls back to the
+    stale copy when the refresh fails so lookups keep working offline.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    stored_at REAL,
+                    last_used REAL
+                )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        finally:
+            conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, key):
+        with self.lock:
+            conn = self.connect()
+            try:
+                row = conn.execute('SELECT value, stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                with conn:
+                    conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+            finally:
+                conn.close()
+        try:
+            return CacheEntry(pickle.loads(row[0]), row[1])
+        except Exception as e:
+            print(f"Dropping unreadable cache entry {key}: {e}")
+            self.delete(key)
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO responses (key, value, stored_at, last_used) VALUES (?, ?, ?, ?)',
+                                 (key, blob, now, now))
+                    # Evict everything past the newest max_entries
+                    conn.execute('''
+                    DELETE FROM responses WHERE key NOT IN (
+                        SELECT key FROM responses ORDER BY last_used DESC LIMIT ?
+                    )
+                    ''', (self.max_entries,))
+            finally:
+                conn.close()
+
+    def delete(self, key):
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            finally:
+                conn.close()
+
+    def clear(self):
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute('DELETE FROM responses')
+            finally:
+                conn.close()
+
+    def get_or_fetch(self, key, ttl, fetch):
+        """Return a cached value younger than ttl seconds, otherwise call fetch() and cache its result.
+
+        If fetch() raises and an older copy exists, the older copy is returned instead.
+        None results are not cached.
+        """
+        entry = self.get(key)
+        if entry is not None and time.time() - entry.stored_at < ttl:
+            return entry.value
+        try:
+            value = fetch()
+        except Exception as e:
+            if entry is not None:
+                print(f"Using cached {key.split(':')[0]} from {time.ctime(entry.stored_at)}: {e}")
+                return entry.value
+            raise
+        if value is not None:
+            self.put(key, value)
+        return value
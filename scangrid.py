@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+ScanButton = namedtuple('ScanButton', ['id', 'state', 'text', 'tgid'])
+
+# Buttons per bank, shown as tabs of PAGE_SIZE buttons each
+BANK_SIZE = 54
+PAGE_SIZE = 9
+
+
+def button_id(number):
+    return f'button{number}'
+
+
+def button_number(button_id):
+    try:
+        return int(button_id.replace('button', ''))
+    except ValueError:
+        return None
+
+
+def bank_button_numbers(bank):
+    """Button numbers of a bank, banks count from 0 and button numbers from 1."""
+    return range(bank * BANK_SIZE + 1, (bank + 1) * BANK_SIZE + 1)
+
+
+def default_buttons(banks):
+    return [ScanButton(button_id(number), 'normal', f'Button {number}', 0)
+            for number in range(1, banks * BANK_SIZE + 1)]
+
+BUTTONS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS buttons (
+    id TEXT PRIMARY KEY,
+    state TEXT,
+    text TEXT,
+    tgid INTEGER
+)
+'''
+
+UPSERT_BUTTON = '''
+INSERT INTO buttons (id, state, text, tgid) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET state = excluded.state, text = excluded.text, tgid = excluded.tgid
+'''
+
+
+class ScanGridModel:
+    """In-memory copy of the ScanGrid buttons table.
+
+    All buttons are read once when the model is created and kept in a dict, so
+    the UI never queries the database. A change writes just the one button that
+    changed, through a connection kept open for the life of the app.
+    """
+
+    def __init__(self, db_path='resources/config/scangrid.db'):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        # Writes can come from the UI and worker threads, the lock keeps them in turn
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(BUTTONS_SCHEMA)
+        self.buttons = {row[0]: ScanButton(*row) for row in
+                        self.conn.execute('SELECT id, state, text, tgid FROM buttons')}
+
+    def __contains__(self, button_id):
+        return button_id in self.buttons
+
+    def __iter__(self):
+        return iter(self.buttons.values())
+
+    def get(self, button_id):
+        return self.buttons.get(button_id)
+
+    def seed(self, defaults):
+        """Add buttons the table doesn't have yet, defaults is an iterable of ScanButton."""
+        missing = [button for button in defaults if button.id not in self.buttons]
+        if missing:
+            self.write(missing)
+
+    def set_state(self, button_id, state):
+        """Record a toggle, returns True if the state actually changed."""
+        button = self.buttons.get(button_id)
+        if button is None:
+            button = ScanButton(button_id, state, '', 0)
+        elif button.state == state:
+            return False
+        self.write([button._replace(state=state)])
+        return True
+
+    def assign(self, button_id, tgid, text):
+        button = self.buttons.get(button_id) or ScanButton(button_id, 'normal', '', 0)
+        self.write([button._replace(tgid=tgid, text=text)])
+
+    def write(self, buttons):
+        with self.lock:
+            try:
+                with self.conn:
+                    self.conn.executemany(UPSERT_BUTTON, buttons)
+            except sqlite3.Error as e:
+                print(f"SQLite error saving ScanGrid buttons: {e}")
+                return
+            for button in buttons:
+                self.buttons[button.id] = button
+
+    def bank_count(self, minimum=1):
+        """Banks needed to show every button in the table, at least minimum."""
+        numbers = [button_number(button_id) for button_id in self.buttons]
+        highest = max([number for number in numbers if number is not None], default=0)
+        return max(minimum, (highest + BANK_SIZE - 1) // BANK_SIZE)
+
+    def active(self):
+        return [button for button in self.buttons.values() if button.state == 'down']
+
+    def whitelist(self):
+        """The active buttons as OP25's WRITE_WHITELIST expects them, tgid:text separated by ';'."""
+        entries = []
+        for button in self.active():
+            # Only the first line of a button's text is its name, the second line is the tgid
+            name = (button.text or '').split('\r\n')[0]
+            entries.append(f"{button.tgid}:{name}")
+        return ";".join(entries)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+from collections import namedtuple
+from math import radians, sin, cos, sqrt, atan2
+
+from zipindex import EARTH_RADIUS_KM
+
+# Field order matches the sites table so existing code indexing [0] / [3] keeps working
+Site = namedtuple('Site', ['site_id', 'latitude', 'longitude', 'site_county'])
+SiteDistance = namedtuple('SiteDistance', ['site', 'distance'])
+
+
+class SiteTable:
+    """All sites of one system, with their coordinates pre-converted for distance math."""
+
+    def __init__(self, system_id, sites, mtime=None):
+        self.system_id = system_id
+        self.sites = sites
+        self.mtime = mtime
+        self.lat_rad = [radians(site.latitude) for site in sites]
+        self.lon_rad = [radians(site.longitude) for site in sites]
+        self.cos_lat = [cos(lat) for lat in self.lat_rad]
+
+    def __len__(self):
+        return len(self.sites)
+
+    def ranked(self, lat, lon):
+        """Every site with its distance in km, closest first."""
+        lat1 = radians(lat)
+        lon1 = radians(lon)
+        cos_lat1 = cos(lat1)
+        results = []
+        for site, lat2, lon2, cos_lat2 in zip(self.sites, self.lat_rad, self.lon_rad, self.cos_lat):
+            a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * sin((lon2 - lon1) / 2) ** 2
+            results.append(SiteDistance(site, EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))))
+        results.sort(key=lambda result: result.distance)
+        return results
+
+    def nearest(self, lat, lon):
+        ranked = self.ranked(lat, lon)
+        return ranked[0] if ranked else None
+
+
+class SiteLocator:
+    """Keeps the selected system's sites in memory between GPS fixes.
+
+    The table is read from resources/systems/{system_id}.db the first time a
+    system is queried and reused until the selected system changes or the
+    database file is rewritten by an import.
+    """
+
+    def __init__(self, systems_directory='resources/systems'):
+        self.systems_directory = systems_directory
+        self.table = None
+
+    def db_path(self, system_id):
+        return os.path.join(self.systems_directory, f"{system_id}.db")
+
+    def invalidate(self):
+        self.table = None
+
+    def sites_for(self, system_id):
+        """Return the SiteTable for a system, or None if it has no database."""
+        if system_id is None or str(system_id).strip() == '':
+            return None
+        system_id = str(system_id)
+        db_path = self.db_path(system_id)
+        if not os.path.isfile(db_path):
+            return None
+
+        mtime = os.path.getmtime(db_path)
+        if self.table is not None and self.table.system_id == system_id and self.table.mtime == mtime:
+            return self.table
+
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                rows = conn.execute("SELECT site_id, latitude, longitude, site_county FROM sites").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"SQLite error loading sites for system {system_id}: {e}")
+            return None
+
+        self.table = SiteTable(system_id, [Site(*row) for row in rows], mtime)
+        return self.table
+
+    def nearest(self, system_id, lat, lon):
+        """Return the closest SiteDistance for the system, or None."""
+        table = self.sites_for(system_id)
+        if table is None:
+            return None
+        return table.nearest(lat, lon)
+
+    def ranked(self, system_id, lat, lon):
+        table = self.sites_for(system_id)
+        if table is None:
+            return []
+        return table.ranked(lat, lon)
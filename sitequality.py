@@ -0,0 +1,216 @@
+import os
+import time
+import sqlite3
+import threading
+
+from sitelocator import SiteDistance
+
+# Control channel decode rate (tsbks per second) we treat as a perfect site
+GOOD_DECODE_RATE = 20.0
+# Quality assumed for sites we have never decoded
+UNKNOWN_QUALITY = 0.7
+# Extra quality for sites our current site is announcing as adjacent
+ANNOUNCED_BONUS = 0.1
+ANNOUNCED_WINDOW = 600
+# A site with zero quality looks this many times further away than it is
+MIN_WEIGHT = 0.25
+# How quickly new decode rate samples replace the old average
+RATE_SMOOTHING = 0.2
+# Ignore samples right after a retune while OP25 restarts and locks on
+SETTLE_SECONDS = 15
+# History older than this no longer says anything about a site
+HISTORY_TTL = 7 * 24 * 3600
+# How often observations are written back to the quality database
+FLUSH_INTERVAL = 60
+
+
+def parse_site_number(value):
+    try:
+        return int(str(value).strip(), 10)
+    except (TypeError, ValueError):
+        return None
+
+
+class SiteQuality:
+    """Tracks how well each site of the selected system actually decodes.
+
+    Telemetry snapshots are attributed to the site OP25 is decoding, giving a
+    smoothed control channel decode rate per site, and adjacent site
+    announcements are remembered as a hint that a neighbour is alive. Sites
+    are then ranked on distance scaled by that quality, so a close site that
+    never decodes loses to a slightly further one that does.
+
+    History is kept in a database of its own rather than in the system
+    databases, so the periodic flush doesn't touch their mtime and make
+    SiteLocator reload the site table.
+    """
+
+    def __init__(self, systems_directory='resources/systems', db_path='resources/config/site_quality.db'):
+        self.systems_directory = systems_directory
+        self.quality_db_path = db_path
+        self.lock = threading.Lock()
+        self.system_id = None
+        self.site_numbers = {}
+        self.rates = {}
+        self.announced = {}
+        self.dirty = False
+        self.last_flush = time.time()
+        self.current_site_id = None
+        self.settle_until = 0
+        self.previous_sample = None
+
+    def db_path(self, system_id):
+        return os.path.join(self.systems_directory, f"{system_id}.db")
+
+    def load(self, system_id):
+        """Switch to a system, loading its stored history. Does nothing if already loaded."""
+        system_id = str(system_id) if system_id is not None else None
+        if system_id == self.system_id:
+            return
+        self.flush()
+        with self.lock:
+            self.system_id = system_id
+            self.site_numbers = {}
+            self.rates = {}
+            self.announced = {}
+            self.current_site_id = None
+            self.previous_sample = None
+        if not system_id or not os.path.isfile(self.db_path(system_id)):
+            return
+
+        try:
+            # Only read from the system database, quality history lives in its own file
+            conn = sqlite3.connect(self.db_path(system_id))
+            try:
+                site_numbers = {(row[1], parse_site_number(row[2])): row[0] for row in conn.execute(
+                    "SELECT site_id, rfss, site_number FROM sites")}
+            except sqlite3.OperationalError:
+                # Systems imported before rfss/site_number were stored can't be matched to telemetry
+                site_numbers = {}
+            finally:
+                conn.close()
+
+            conn = self.connect()
+            try:
+                cutoff = time.time() - HISTORY_TTL
+                rates = {row[0]: (row[1], row[2]) for row in conn.execute(
+                    "SELECT site_id, decode_rate, last_seen FROM site_quality WHERE system_id = ? AND last_seen >= ?",
+                    (system_id, cutoff))}
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"SQLite error loading site quality for system {system_id}: {e}")
+            return
+
+        with self.lock:
+            self.rates = rates
+            self.site_numbers = site_numbers
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.quality_db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.quality_db_path)
+        with conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS site_quality (
+                system_id TEXT,
+                site_id INTEGER,
+                decode_rate REAL,
+                last_seen REAL,
+                PRIMARY KEY (system_id, site_id)
+            )
+            ''')
+        return conn
+
+    def set_current_site(self, site_id, now=None):
+        """Called when OP25 is retuned, observations are attributed to this site."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self.current_site_id = site_id
+            self.settle_until = now + SETTLE_SECONDS
+            self.previous_sample = None
+
+    def site_for(self, rfid, stid):
+        if rfid is None or stid is None:
+            return None
+        return self.site_numbers.get((rfid, stid))
+
+    def observe(self, snapshot):
+        """Telemetry subscriber, runs on the OP25Client poll thread."""
+        values = snapshot.values
+        now = snapshot.timestamp
+        trunk_update = values.get('trunk_update') if values else None
+        if not trunk_update or self.system_id is None:
+            return
+
+        with self.lock:
+            # Prefer the site OP25 says it is decoding, else the one we told it to use
+            site_id = self.site_for(trunk_update.get('rfid'), trunk_update.get('stid')) or self.current_site_id
+
+            for adjacent in (trunk_update.get('adjacent_data') or {}).values():
+                adjacent_site = self.site_for(adjacent.get('rfid'), adjacent.get('stid'))
+                if adjacent_site is not None:
+                    self.announced[adjacent_site] = now
+
+            tsbks = trunk_update.get('tsbks')
+            if site_id is None or tsbks is None or now < self.settle_until:
+                self.previous_sample = None
+                return
+
+            previous = self.previous_sample
+            self.previous_sample = (site_id, tsbks, now)
+            # Need two samples from the same site, and a counter that didn't reset
+            if previous is None or previous[0] != site_id or tsbks < previous[1] or now <= previous[2]:
+                return
+
+            rate = (tsbks - previous[1]) / (now - previous[2])
+            old_rate = self.rates.get(site_id, (None, None))[0]
+            if old_rate is not None:
+                rate = old_rate + RATE_SMOOTHING * (rate - old_rate)
+            self.rates[site_id] = (rate, now)
+            self.dirty = True
+
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or self.system_id is None:
+                self.last_flush = time.time()
+                return
+            system_id = self.system_id
+            rows = [(system_id, site_id, rate, last_seen) for site_id, (rate, last_seen) in self.rates.items()]
+            self.dirty = False
+            self.last_flush = time.time()
+
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO site_quality (system_id, site_id, decode_rate, last_seen) "
+                                     "VALUES (?, ?, ?, ?)", rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"SQLite error saving site quality for system {system_id}: {e}")
+
+    def quality(self, site_id, now=None):
+        """0 (never decodes) to 1 (decodes perfectly), UNKNOWN_QUALITY if never tried."""
+        if now is None:
+            now = time.time()
+        rate = self.rates.get(site_id, (None, None))[0]
+        quality = UNKNOWN_QUALITY if rate is None else min(1.0, rate / GOOD_DECODE_RATE)
+        if now - self.announced.get(site_id, 0) < ANNOUNCED_WINDOW:
+            quality = min(1.0, quality + ANNOUNCED_BONUS)
+        return quality
+
+    def ranked(self, table, lat, lon, now=None):
+        """Rank sites on distance scaled by quality, returned distances are the scaled ones."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            results = [SiteDistance(result.site,
+                                    result.distance / (MIN_WEIGHT + (1 - MIN_WEIGHT) * self.quality(result.site.site_id, now)))
+                       for result in table.ranked(lat, lon)]
+        results.sort(key=lambda result: result.distance)
+        return results
@@ -0,0 +1,128 @@
+import time
+from math import radians, degrees, sin, cos, asin, atan2
+
+from zipindex import EARTH_RADIUS_KM
+
+# A new site has to be at least this much closer than the current one before we retune,
+# whichever of the two margins is larger
+HYSTERESIS_KM = 2.0
+HYSTERESIS_RATIO = 0.1
+# Minimum time to stay on a site after switching to it
+MIN_DWELL_SECONDS = 60
+# How far ahead to project our position when we're moving
+PREDICTION_SECONDS = 30
+# Below this speed (m/s) bearing is too noisy to predict with
+MIN_PREDICTION_SPEED = 3.0
+
+
+def project_position(lat, lon, speed, bearing, seconds):
+    """Where we will be after `seconds` at `speed` m/s heading `bearing` degrees."""
+    distance = speed * seconds / 1000.0 / EARTH_RADIUS_KM
+    lat1 = radians(lat)
+    lon1 = radians(lon)
+    heading = radians(bearing)
+    lat2 = asin(sin(lat1) * cos(distance) + cos(lat1) * sin(distance) * cos(heading))
+    lon2 = lon1 + atan2(sin(heading) * sin(distance) * cos(lat1), cos(distance) - sin(lat1) * sin(lat2))
+    return degrees(lat2), degrees(lon2)
+
+
+class SiteSwitcher:
+    """Decides when OP25 should retune to a different site of the selected system.
+
+    Every retune restarts OP25 and drops audio, so instead of following the
+    nearest site blindly we require a clear distance margin, a minimum dwell
+    time on the current site and, when moving, that our projected position
+    agrees with the switch. Restarts a naive nearest-site switch would have made
+    are counted as well so the saving can be shown.
+
+    With a SiteQuality the distances are scaled by how well each site decodes,
+    so everything above applies to quality weighted distances. The naive count
+    always follows the plain nearest site, so avoided_restarts compares against
+    the same baseline with or without quality.
+    """
+
+    def __init__(self, hysteresis_km=HYSTERESIS_KM, hysteresis_ratio=HYSTERESIS_RATIO,
+                 min_dwell=MIN_DWELL_SECONDS, prediction_seconds=PREDICTION_SECONDS, quality=None):
+        self.quality = quality
+        self.hysteresis_km = hysteresis_km
+        self.hysteresis_ratio = hysteresis_ratio
+        self.min_dwell = min_dwell
+        self.prediction_seconds = prediction_seconds
+        self.reset()
+
+    def reset(self):
+        self.current_site = None
+        self.switched_at = 0
+        self.naive_site = None
+        self.switches = 0
+        self.naive_switches = 0
+
+    @property
+    def avoided_restarts(self):
+        return max(0, self.naive_switches - self.switches)
+
+    def margin(self, current_distance, accuracy=None):
+        margin = max(self.hysteresis_km, current_distance * self.hysteresis_ratio)
+        # Don't trust a fix that is less accurate than the margin itself
+        if accuracy:
+            margin = max(margin, accuracy / 1000.0)
+        return margin
+
+    def rank(self, table, lat, lon, now):
+        if self.quality is not None:
+            return self.quality.ranked(table, lat, lon, now)
+        return table.ranked(lat, lon)
+
+    def update(self, table, lat, lon, speed=None, bearing=None, accuracy=None, now=None):
+        """Feed a GPS fix, returns the Site to switch to or None to stay put."""
+        if table is None or not len(table):
+            return None
+        if now is None:
+            now = time.time()
+
+        ranked = self.rank(table, lat, lon, now)
+        nearest = ranked[0]
+
+        # Keep track of what always-switch-to-nearest would have done, by raw distance
+        naive_nearest = nearest if self.quality is None else table.nearest(lat, lon)
+        if naive_nearest.site.site_id != self.naive_site:
+            self.naive_site = naive_nearest.site.site_id
+            self.naive_switches += 1
+
+        # First fix, or the current site is no longer part of this system
+        distances = {result.site.site_id: result.distance for result in ranked}
+        if self.current_site is None or self.current_site.site_id not in distances:
+            return self.switch_to(nearest.site, now)
+
+        if nearest.site.site_id == self.current_site.site_id:
+            return None
+        if now - self.switched_at < self.min_dwell:
+            return None
+
+        current_distance = distances[self.current_site.site_id]
+        margin = self.margin(current_distance, accuracy)
+        beneficial_now = current_distance - nearest.distance >= margin
+
+        if speed and bearing is not None and speed >= MIN_PREDICTION_SPEED:
+            future_lat, future_lon = project_position(lat, lon, speed, bearing, self.prediction_seconds)
+            future = {result.site.site_id: result.distance
+                      for result in self.rank(table, future_lat, future_lon, now)}
+            future_gain = future[self.current_site.site_id] - future[nearest.site.site_id]
+            # Heading back towards the current site, hold on to it
+            if future_gain <= 0:
+                return None
+            # Heading firmly towards the new site, switch without waiting for the full margin
+            if future_gain >= margin:
+                return self.switch_to(nearest.site, now)
+
+        if beneficial_now:
+            return self.switch_to(nearest.site, now)
+        return None
+
+    def switch_to(self, site, now):
+        self.current_site = site
+        self.switched_at = now
+        self.switches += 1
+        if self.quality is not None:
+            self.quality.set_current_site(site.site_id, now)
+        return site
@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+
+# Taken when main.py imports this module, before Kivy and everything else is imported
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Times the phases of app startup and the screens built after it.
+
+    mark() records a point in time since the process started, measure() the
+    duration of a block. report() gives both as text for the log.
+    """
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.marks = []
+        self.durations = []
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - self.start))
+
+    @contextmanager
+    def measure(self, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations.append((label, time.perf_counter() - start))
+
+    def elapsed(self, label):
+        for mark, seconds in self.marks:
+            if mark == label:
+                return seconds
+        return None
+
+    def report(self):
+        lines = [f"{label:<28} {seconds * 1000:8.0f} ms since launch" for label, seconds in self.marks]
+        lines += [f"{label:<28} {seconds * 1000:8.0f} ms" for label, seconds in self.durations]
+        return '\n'.join(lines)
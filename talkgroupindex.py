@@ -0,0 +1,140 @@
+import os
+import bisect
+import sqlite3
+import difflib
+from collections import namedtuple
+
+Talkgroup = namedtuple('Talkgroup', ['tg_dec', 'tg_alpha'])
+
+# Results returned by a search when the caller doesn't say
+DEFAULT_SEARCH_LIMIT = 20
+# How similar a name has to be to count as a fuzzy match, 0 to 1
+FUZZY_CUTOFF = 0.6
+
+
+class TalkgroupTable:
+    """All talkgroups of one system.
+
+    tags maps tg_dec to its alpha tag for O(1) lookups. For searching, the
+    decimal ids and the lowercased alpha tags are each kept sorted so a prefix
+    search is a bisect rather than a scan.
+    """
+
+    def __init__(self, system_id, talkgroups):
+        self.system_id = system_id
+        self.tags = {tg_dec: tg_alpha for tg_dec, tg_alpha in talkgroups}
+        self.by_dec = sorted((str(tg_dec), tg_dec) for tg_dec in self.tags)
+        self.by_alpha = sorted(((tg_alpha or '').lower(), tg_dec) for tg_dec, tg_alpha in self.tags.items())
+        self.fuzzy_candidates = None
+
+    def __len__(self):
+        return len(self.tags)
+
+    def tag(self, tgid):
+        try:
+            return self.tags.get(int(tgid))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def prefixed(keys, prefix):
+        for position in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+            key, tg_dec = keys[position]
+            if not key.startswith(prefix):
+                break
+            yield tg_dec
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        """Talkgroups matching a decimal id prefix or a name, best matches first.
+
+        Names are matched by prefix, then by the start of any word, then fuzzily.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        if query.isdigit():
+            matches = self.prefixed(self.by_dec, query)
+        else:
+            matches = self.name_matches(query)
+
+        results = []
+        seen = set()
+        for tg_dec in matches:
+            if tg_dec not in seen:
+                seen.add(tg_dec)
+                results.append(Talkgroup(tg_dec, self.tags[tg_dec]))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def name_matches(self, query):
+        yield from self.prefixed(self.by_alpha, query)
+        word_prefix = ' ' + query
+        for name, tg_dec in self.by_alpha:
+            if word_prefix in name:
+                yield tg_dec
+        # Fuzzy matching compares against whole names and their single words, so typos still hit
+        if self.fuzzy_candidates is None:
+            self.fuzzy_candidates = {}
+            for name, tg_dec in self.by_alpha:
+                for candidate in [name] + name.split():
+                    self.fuzzy_candidates.setdefault(candidate, []).append(tg_dec)
+        candidates = self.fuzzy_candidates
+        for candidate in difflib.get_close_matches(query, list(candidates), n=DEFAULT_SEARCH_LIMIT, cutoff=FUZZY_CUTOFF):
+            yield from candidates[candidate]
+
+
+class TalkgroupIndex:
+    """Keeps the selected system's talkgroups in memory for tag lookups.
+
+    The table is read from resources/systems/{system_id}.db the first time a
+    system is asked for and kept until invalidate() is called, so resolving a
+    tgid on every telemetry update never touches the database.
+    """
+
+    def __init__(self, systems_directory='resources/systems'):
+        self.systems_directory = systems_directory
+        self.table = None
+
+    def db_path(self, system_id):
+        return os.path.join(self.systems_directory, f"{system_id}.db")
+
+    def invalidate(self):
+        self.table = None
+
+    def talkgroups_for(self, system_id):
+        """Return the TalkgroupTable for a system, or None if it has no talkgroups stored."""
+        if system_id is None or str(system_id).strip() == '':
+            return None
+        system_id = str(system_id)
+        if self.table is not None and self.table.system_id == system_id:
+            return self.table
+
+        db_path = self.db_path(system_id)
+        rows = []
+        if os.path.isfile(db_path):
+            try:
+                conn = sqlite3.connect(db_path)
+                try:
+                    rows = conn.execute("SELECT tg_dec, tg_alpha FROM talkgroups").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                # Databases imported before talkgroups were stored on the phone have no table
+                print(f"Unable to load talkgroups for system {system_id}: {e}")
+
+        # Cached even when empty so a missing database isn't retried on every update
+        self.table = TalkgroupTable(system_id, rows)
+        return self.table
+
+    def tag(self, system_id, tgid):
+        table = self.talkgroups_for(system_id)
+        if table is None:
+            return None
+        return table.tag(tgid)
+
+    def search(self, system_id, query, limit=DEFAULT_SEARCH_LIMIT):
+        table = self.talkgroups_for(system_id)
+        if table is None:
+            return []
+        return table.search(query, limit)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Modules such as updater read resources/config/config.ini relative to the working directory, as the app does
+os.chdir(ROOT)
@@ -0,0 +1,15 @@
+from bulkimport import BulkImporter
+
+
+def site(site_id):
+    return {'siteId': site_id, 'lat': 40.0, 'lon': -82.0, 'siteDescr': f'Site {site_id}'}
+
+
+def test_a_bad_system_does_not_stop_the_others(tmp_path):
+    bundles = [{'system_id': '1', 'sites': [site(1)], 'talkgroups': [[101, 'Fire']]},
+               {'system_id': '2', 'sites': [{'lat': 40.0}], 'talkgroups': []},
+               {'system_id': '3', 'sites': [site(3)], 'talkgroups': []}]
+    changes, failed = BulkImporter.write_databases(bundles, str(tmp_path))
+    assert failed == ['2']
+    assert set(changes) == {'1', '3'}
+    assert (tmp_path / '3.db').exists()
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from resources.config.configure import Configure, get_config
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / 'config.ini'
+    path.write_text('[SDR]\nsdr = RTL-SDR\ngain = 44\n')
+    return str(path)
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    count = [0]
+    original = Configure.save_config
+
+    def counting_save(self):
+        count[0] += 1
+        original(self)
+    monkeypatch.setattr(Configure, 'save_config', counting_save)
+    return count
+
+
+def test_batch_saves_once_and_notifies_after(config_path, saves):
+    config = Configure(config_path)
+    seen = []
+    config.subscribe(lambda *change: seen.append(change), section='SDR')
+    with config.batch():
+        config.set('SDR', 'gain', 30)
+        config.set('SDR', 'sdr', 'HackRF')
+        config.set('RCH', 'TIME24', True)
+        assert seen == []
+    assert saves[0] == 1
+    assert seen == [('SDR', 'gain', '30'), ('SDR', 'sdr', 'HackRF')]
+    reloaded = Configure(config_path)
+    assert reloaded.get_int('SDR', 'gain') == 30
+    assert reloaded.get_bool('RCH', 'time24') is True
+
+
+def test_unchanged_value_is_not_saved(config_path, saves):
+    config = Configure(config_path)
+    config.set('SDR', 'gain', '44')
+    assert saves[0] == 0
+
+
+def test_failed_batch_is_rolled_back_and_not_saved(config_path, saves):
+    config = Configure(config_path)
+    before = open(config_path).read()
+    with pytest.raises(ValueError):
+        with config.batch():
+            config.set('SDR', 'gain', 1)
+            config.set('NEW', 'option', 'value')
+            raise ValueError
+    assert config.get('SDR', 'gain') == '44'
+    assert not config.has_section('NEW')
+    assert saves[0] == 0
+    assert open(config_path).read() == before
+
+
+def test_subscriber_may_use_the_config(config_path):
+    config = Configure(config_path)
+    config.subscribe(lambda section, option, value: config.set('SDR', 'seen', value), section='SDR')
+    config.set('SDR', 'gain', 30)
+    assert config.get('SDR', 'seen') == '30'
+
+
+def test_save_leaves_no_temporary_files(config_path):
+    config = Configure(config_path)
+    config.set('SDR', 'gain', 30)
+    assert os.listdir(os.path.dirname(config_path)) == ['config.ini']
+
+
+def test_missing_optional_file_is_created_on_first_save(tmp_path):
+    path = tmp_path / 'nested' / 'credentials.ini'
+    config = get_config(str(path), required=False)
+    assert get_config(str(path)) is config
+    config.set('RadioReference', 'username', 'user')
+    assert Configure(str(path)).get('RadioReference', 'username') == 'user'
+    with pytest.raises(FileNotFoundError):
+        Configure(str(tmp_path / 'missing.ini'))
@@ -0,0 +1,100 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from updater import ControlChannel, OP25Client
+
+
+class StubServer:
+    """Local mchserver stand-in: one command per connection, replying after a delay."""
+
+    def __init__(self, delay=0, reply=b'ACK', close=True):
+        self.delay = delay
+        self.reply = reply
+        self.close = close
+        self.commands = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        with conn:
+            self.commands.append(conn.recv(1024).decode())
+            time.sleep(self.delay)
+            conn.sendall(self.reply)
+            if not self.close:
+                # Wait for the client to hang up, the way a server reading the next command would
+                while conn.recv(1024):
+                    pass
+
+
+@pytest.fixture
+def server(request):
+    server = StubServer(**getattr(request, 'param', {}))
+    yield server
+    server.sock.close()
+
+
+@pytest.mark.parametrize('server', [{'delay': 1.5}], indirect=True)
+def test_slow_reply_is_read_and_command_sent_once(server):
+    channel = ControlChannel('127.0.0.1', server.port)
+    assert channel.request('START_SYSTEM;1;2') == 'ACK'
+    assert server.commands == ['START_SYSTEM;1;2']
+
+
+@pytest.mark.parametrize('server', [{'delay': 0.5}], indirect=True)
+def test_missing_reply_is_not_retried(server):
+    channel = ControlChannel('127.0.0.1', server.port, reply_timeout=0.1)
+    assert channel.request('INCREASE_VOLUME') == 'FAIL'
+    time.sleep(0.6)
+    assert server.commands == ['INCREASE_VOLUME']
+
+
+@pytest.mark.parametrize('server', [{'close': False}, {'close': False, 'reply': b'ACK\n'}], indirect=True)
+def test_reply_does_not_wait_for_a_server_that_keeps_the_socket_open(server):
+    channel = ControlChannel('127.0.0.1', server.port)
+    start = time.perf_counter()
+    assert channel.request('HELLO') == 'ACK'
+    assert time.perf_counter() - start < 0.5
+
+
+def test_refused_connection_is_retried_then_fails():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    assert ControlChannel('127.0.0.1', port, retries=1).request('HELLO') == 'FAIL'
+
+
+
+@pytest.mark.parametrize('server', [{'reply': b'\xff\xfeACK'}], indirect=True)
+def test_undecodable_reply_does_not_stop_the_worker(server):
+    channel = ControlChannel('127.0.0.1', server.port)
+    assert channel.request('HELLO') == '\ufffd\ufffdACK'
+    channel.exchange = lambda command: 1 / 0
+    assert channel.request('HELLO') == 'FAIL'
+    thread = channel.thread
+    del channel.exchange
+    assert channel.request('HELLO') == '\ufffd\ufffdACK'
+    assert channel.thread is thread
+
+
+def test_new_address_is_used_by_the_next_command(server):
+    client = OP25Client('http://127.0.0.1:9')
+    client.control.host, client.control.port = '127.0.0.1', 9
+    assert client.control.request('HELLO') == 'FAIL'
+    client.set_address('127.0.0.1', 8080, server.port)
+    assert client.url == 'http://127.0.0.1:8080'
+    assert client.control.request('HELLO') == 'ACK'
@@ -0,0 +1,128 @@
+import pytest
+
+import radioreference
+import responsecache
+from benchmark_bulkimport import StandInService, StandInClient
+from radioreference import GetSystems
+from responsecache import ResponseCache, cache_key
+
+
+class CountingService(StandInService):
+    """Stand-in RadioReference service that counts calls and can be made to fail."""
+
+    def __init__(self):
+        super().__init__(latency=0, site_count=2, talkgroup_count=3)
+        self.calls = []
+        self.failing = False
+
+    def getTrsTalkgroups(self, sid, cat_id, tag_id, tg_dec, authInfo):
+        self.calls.append(sid)
+        if self.failing:
+            raise ConnectionError('RadioReference unreachable')
+        return super().getTrsTalkgroups(sid, cat_id, tag_id, tg_dec, authInfo)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(responsecache.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / 'cache.db'))
+
+
+@pytest.fixture
+def service():
+    return CountingService()
+
+
+@pytest.fixture
+def client(cache, service):
+    return GetSystems('user', 'secret', cache=cache, ttls={'getTrsTalkgroups': 60},
+                      soap_client=StandInClient(service))
+
+
+def test_cache_key_depends_on_method_and_args():
+    assert cache_key('getTrsSites', ('1',)) == cache_key('getTrsSites', ('1',))
+    assert cache_key('getTrsSites', ('1',)) != cache_key('getTrsSites', ('2',))
+    assert cache_key('getTrsSites', ('1',)) != cache_key('getTrsTalkgroups', ('1',))
+
+
+def test_repeat_lookup_is_a_cache_hit(client, service):
+    first = client.get_trs_talkgroups('7')
+    assert client.get_trs_talkgroups('7') == first
+    assert service.calls == ['7']
+
+
+def test_other_system_is_a_miss(client, service):
+    client.get_trs_talkgroups('7')
+    client.get_trs_talkgroups('8')
+    assert service.calls == ['7', '8']
+
+
+def test_expired_entry_is_fetched_again(client, service, clock):
+    client.get_trs_talkgroups('7')
+    clock[0] += 59
+    client.get_trs_talkgroups('7')
+    assert service.calls == ['7']
+    clock[0] += 2
+    client.get_trs_talkgroups('7')
+    assert service.calls == ['7', '7']
+
+
+def test_refresh_skips_a_fresh_entry(client, service):
+    client.get_trs_talkgroups('7')
+    client.get_trs_talkgroups('7', refresh=True)
+    assert service.calls == ['7', '7']
+
+
+def test_failed_refresh_serves_the_stale_copy(client, service, clock):
+    first = client.get_trs_talkgroups('7')
+    clock[0] += 3600
+    service.failing = True
+    assert client.get_trs_talkgroups('7') == first
+
+
+def test_errors_are_not_cached(client, service):
+    service.failing = True
+    assert client.get_trs_talkgroups('7') is None
+    service.failing = False
+    assert client.get_trs_talkgroups('7')
+    assert service.calls == ['7', '7']
+
+
+def test_none_results_are_not_cached(cache):
+    results = [None, 'value']
+    assert cache.get_or_fetch('key', 60, lambda: results.pop(0)) is None
+    assert cache.get_or_fetch('key', 60, lambda: results.pop(0)) == 'value'
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_entries=2)
+    cache.put('a', 1)
+    clock[0] += 1
+    cache.put('b', 2)
+    clock[0] += 1
+    cache.get('a')
+    clock[0] += 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a').value == 1
+    assert cache.get('c').value == 3
+
+
+def test_default_cache_is_shared_and_used(tmp_path, monkeypatch, service):
+    # GetSystems built the way main.py does, without a cache of its own
+    monkeypatch.setattr(radioreference, 'RESPONSE_CACHE_PATH', str(tmp_path / 'rr_cache.db'))
+    monkeypatch.setattr(radioreference, '_response_cache', None)
+    first = GetSystems('user', 'secret', soap_client=StandInClient(service))
+    second = GetSystems('user', 'secret', soap_client=StandInClient(service))
+
+    assert first.get_trs_talkgroups('7')
+    assert second.get_trs_talkgroups('7') == first.get_trs_talkgroups('7')
+    assert service.calls == ['7']
+    assert radioreference.get_response_cache() is radioreference.get_response_cache()
+    assert (tmp_path / 'rr_cache.db').exists()
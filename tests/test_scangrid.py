@@ -0,0 +1,42 @@
+from scangrid import BANK_SIZE, ScanButton, ScanGridModel, bank_button_numbers, button_id, button_number, default_buttons
+
+
+def test_button_numbering():
+    assert button_number(button_id(12)) == 12
+    assert button_number('other') is None
+    assert list(bank_button_numbers(1))[0] == BANK_SIZE + 1
+    assert len(default_buttons(2)) == 2 * BANK_SIZE
+
+
+def test_changes_are_kept_in_memory_and_on_disk(tmp_path):
+    db_path = str(tmp_path / 'scangrid.db')
+    model = ScanGridModel(db_path)
+    model.seed(default_buttons(1))
+    assert model.set_state('button1', 'down')
+    assert not model.set_state('button1', 'down')
+    model.assign('button1', 101, 'Fire Dispatch')
+    model.assign('button2', 102, 'Police')
+    assert model.get('button1') == ScanButton('button1', 'down', 'Fire Dispatch', 101)
+    model.close()
+
+    reopened = ScanGridModel(db_path)
+    assert reopened.get('button1') == ScanButton('button1', 'down', 'Fire Dispatch', 101)
+    assert reopened.get('button2').state == 'normal'
+    reopened.close()
+
+
+def test_whitelist_lists_active_buttons_by_first_line_of_their_text(tmp_path):
+    model = ScanGridModel(str(tmp_path / 'scangrid.db'))
+    model.write([ScanButton('button1', 'down', 'Fire\r\n101', 101), ScanButton('button2', 'normal', 'Police', 102),
+                 ScanButton('button3', 'down', 'EMS', 103)])
+    assert sorted(model.whitelist().split(';')) == ['101:Fire', '103:EMS']
+    model.close()
+
+
+def test_bank_count_covers_the_highest_button(tmp_path):
+    model = ScanGridModel(str(tmp_path / 'scangrid.db'))
+    assert model.bank_count(minimum=1) == 1
+    model.assign(button_id(BANK_SIZE + 1), 101, 'Fire')
+    assert model.bank_count(minimum=1) == 2
+    assert model.bank_count(minimum=3) == 3
+    model.close()
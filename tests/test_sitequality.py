@@ -0,0 +1,94 @@
+import os
+import sqlite3
+from collections import namedtuple
+
+import pytest
+
+from sitelocator import SiteLocator
+from sitequality import SiteQuality
+from siteswitcher import SiteSwitcher
+
+Snapshot = namedtuple('Snapshot', ['values', 'timestamp'])
+
+# Two sites about 5.5 km apart on the same longitude
+SITES = [(10, '1', 1, 'North', 40.0, -82.0), (20, '2', 1, 'South', 39.95, -82.0)]
+
+
+@pytest.fixture
+def systems(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / '1.db'))
+    with conn:
+        conn.execute('CREATE TABLE sites (site_id INTEGER PRIMARY KEY, site_number TEXT, rfss INTEGER, '
+                     'site_county TEXT, latitude REAL, longitude REAL)')
+        conn.executemany('INSERT INTO sites VALUES (?, ?, ?, ?, ?, ?)', SITES)
+    conn.close()
+    return str(tmp_path)
+
+
+def decode(quality, site_number, tsbks_per_second, start, seconds=3):
+    for second in range(seconds):
+        quality.observe(Snapshot({'trunk_update': {'rfid': 1, 'stid': site_number,
+                                                   'tsbks': second * tsbks_per_second}}, start + second))
+
+
+def test_flush_leaves_the_system_database_alone(systems, tmp_path):
+    locator = SiteLocator(systems)
+    table = locator.sites_for('1')
+    mtime = os.path.getmtime(os.path.join(systems, '1.db'))
+
+    quality = SiteQuality(systems, str(tmp_path / 'quality' / 'site_quality.db'))
+    quality.load('1')
+    decode(quality, 1, 20, start=0)
+    quality.flush()
+
+    assert os.path.getmtime(os.path.join(systems, '1.db')) == mtime
+    assert locator.sites_for('1') is table
+    assert quality.rates[10][0] == 20
+
+
+def test_history_is_reloaded_per_system(systems, tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'site_quality.db')
+    quality = SiteQuality(systems, db_path)
+    quality.load('1')
+    now = 1_000_000
+    monkeypatch.setattr('sitequality.time.time', lambda: now)
+    decode(quality, 2, 10, start=now - 10)
+    quality.flush()
+
+    reloaded = SiteQuality(systems, db_path)
+    reloaded.load('1')
+    assert reloaded.rates[20][0] == 10
+    reloaded.load('2')
+    assert reloaded.rates == {}
+
+
+# Timestamps well past the adjacent site announcement window
+NOW = 1_000_000
+
+
+@pytest.fixture
+def ranked_quality(systems, tmp_path):
+    """North never decodes, South decodes perfectly."""
+    quality = SiteQuality(systems, str(tmp_path / 'site_quality.db'))
+    quality.load('1')
+    decode(quality, 1, 0, start=NOW)
+    decode(quality, 2, 20, start=NOW + 100)
+    return quality
+
+
+def test_ranking_prefers_a_site_that_decodes(systems, ranked_quality):
+    table = SiteLocator(systems).sites_for('1')
+    # 2.2 km from North and 3.3 km from South
+    assert table.nearest(39.98, -82.0).site.site_id == 10
+    assert ranked_quality.ranked(table, 39.98, -82.0, now=NOW + 200)[0].site.site_id == 20
+
+
+def test_naive_switches_count_raw_distance(systems, ranked_quality):
+    table = SiteLocator(systems).sites_for('1')
+    switcher = SiteSwitcher(quality=ranked_quality, min_dwell=0)
+    # Quality keeps us on South the whole time, the plain nearest site flips at every fix
+    for step, lat in enumerate((39.98, 39.96, 39.98, 39.96)):
+        switcher.update(table, lat, -82.0, now=NOW + 200 + step)
+    assert switcher.switches == 1
+    assert switcher.naive_switches == 4
+    assert switcher.avoided_restarts == 3
@@ -0,0 +1,46 @@
+from sitelocator import Site, SiteTable
+from siteswitcher import SiteSwitcher, project_position
+
+# Sites 10 km apart along a meridian, about 1.11 km per 0.01 degree
+TABLE = SiteTable('1', [Site(1, 40.0, -82.0, 'A'), Site(2, 40.09, -82.0, 'B')])
+
+
+def test_first_fix_switches_to_the_nearest_site():
+    switcher = SiteSwitcher()
+    assert switcher.update(TABLE, 40.01, -82.0, now=0).site_id == 1
+
+
+def test_small_advantage_does_not_switch():
+    switcher = SiteSwitcher(min_dwell=0)
+    switcher.update(TABLE, 40.01, -82.0, now=0)
+    # Just past the midpoint, B is closer but by less than the hysteresis margin
+    assert switcher.update(TABLE, 40.05, -82.0, now=100) is None
+    assert switcher.naive_switches == 2
+    assert switcher.avoided_restarts == 1
+
+
+def test_clear_advantage_switches_after_dwell():
+    switcher = SiteSwitcher(min_dwell=60)
+    switcher.update(TABLE, 40.01, -82.0, now=0)
+    assert switcher.update(TABLE, 40.08, -82.0, now=30) is None
+    assert switcher.update(TABLE, 40.08, -82.0, now=61).site_id == 2
+
+
+def test_heading_towards_the_new_site_switches_early():
+    switcher = SiteSwitcher(min_dwell=0)
+    switcher.update(TABLE, 40.01, -82.0, now=0)
+    # Barely closer to B, but driving north at 30 m/s
+    assert switcher.update(TABLE, 40.05, -82.0, speed=30, bearing=0, now=100).site_id == 2
+
+
+def test_heading_back_holds_the_current_site():
+    switcher = SiteSwitcher(min_dwell=0)
+    switcher.update(TABLE, 40.01, -82.0, now=0)
+    # Clearly closer to B, but driving south towards A at 60 m/s
+    assert switcher.update(TABLE, 40.059, -82.0, speed=60, bearing=180, now=100) is None
+
+
+def test_project_position_moves_north():
+    lat, lon = project_position(40.0, -82.0, speed=10, bearing=0, seconds=100)
+    assert 40.008 < lat < 40.01
+    assert abs(lon + 82.0) < 1e-9
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from radioreference import GetSystems, TalkgroupChanges, describe_changes
+
+
+def site(site_id):
+    return {'siteId': site_id, 'lat': 40.0, 'lon': -82.0, 'siteDescr': f'Site {site_id}'}
+
+
+def bundle(sites, talkgroups):
+    return {'system_id': '1234', 'sites': sites, 'talkgroups': talkgroups}
+
+
+@pytest.fixture
+def systems(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return GetSystems('user', 'pass')
+
+
+def test_unchanged_only_when_a_sync_found_nothing(systems):
+    first = systems.create_system_database('1234', bundle([site(1)], [[101, 'Fire']]))
+    assert describe_changes(first) == "1 talkgroups added, 0 renamed, 0 removed"
+    again = systems.create_system_database('1234', bundle([site(1)], [[101, 'Fire']]))
+    assert describe_changes(again) == "talkgroups unchanged"
+    # The talkgroup download failed, nothing was synced
+    failed = systems.create_system_database('1234', bundle([site(1)], []))
+    assert failed is None
+    assert describe_changes(failed) == "no talkgroups downloaded"
+
+
+def test_save_errors_reach_the_caller(systems):
+    with pytest.raises(KeyError):
+        systems.create_system_database('1234', bundle([{'lat': 40.0}], [[101, 'Fire']]))
+
+
+def test_describe_changes_counts_each_kind():
+    assert describe_changes(TalkgroupChanges([1, 2], [3], [])) == "2 talkgroups added, 1 renamed, 0 removed"
+
+
+def test_reimport_drops_sites_no_longer_listed(systems, tmp_path):
+    systems.create_system_database('1234', bundle([site(1), site(2)], []))
+    systems.create_system_database('1234', bundle([site(2), site(3)], []))
+    conn = sqlite3.connect(str(tmp_path / 'resources' / 'systems' / '1234.db'))
+    try:
+        assert [row[0] for row in conn.execute('SELECT site_id FROM sites ORDER BY site_id')] == [2, 3]
+    finally:
+        conn.close()
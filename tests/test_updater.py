@@ -0,0 +1,29 @@
+from updater import OP25Client, diff_values, has_changed
+
+
+def poll(client, values):
+    client.get_latest_values = lambda: values
+    return client.poll_once()
+
+
+def test_diff_reports_changed_added_and_removed_fields():
+    previous = {'trunk_update': {'grpaddr': 101, 'srcaddr': 5, 'frequency_data': {}}, 'rx_update': {'error': 0}}
+    current = {'trunk_update': {'grpaddr': 101, 'srcaddr': 6, 'tsbks': 10}}
+    changes = diff_values(previous, current)
+    assert changes == {'trunk_update': {'srcaddr': 6, 'tsbks': 10, 'frequency_data': None}, 'rx_update': None}
+    assert has_changed(changes, 'trunk_update', 'frequency_data')
+    assert not has_changed(changes, 'trunk_update', 'grpaddr')
+
+
+def test_active_calls_follow_the_current_values():
+    client = OP25Client('http://127.0.0.1:9')
+    calls = poll(client, {'trunk_update': {'frequency_data': {'851.0': {'tgids': [101, None]}}}}).active_calls
+    assert calls.talkgroups == {101}
+
+    # frequency_data gone from the update, the call has ended
+    assert poll(client, {'trunk_update': {'srcaddr': 6}}).active_calls.talkgroups == frozenset()
+
+    first = poll(client, {'trunk_update': {'srcaddr': 6, 'frequency_data': {'851.0': {'tgids': [102]}}}})
+    second = poll(client, {'trunk_update': {'srcaddr': 7, 'frequency_data': {'851.0': {'tgids': [102]}}}})
+    assert second.active_calls is first.active_calls
+    assert dict(second.active_calls.occupancy) == {'851.0': (102,)}
@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+pytest.importorskip('zeep')
+
+import radioreference
+from radioreference import GetSystems
+
+WSDL = b'''<?xml version="1.0" encoding="UTF-8"?>
+<definitions name="Stub" targetNamespace="urn:stub"
+    xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:tns="urn:stub"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <message name="getUserDataRequest"><part name="authInfo" type="xsd:string"/></message>
+  <message name="getUserDataResponse"><part name="return" type="xsd:string"/></message>
+  <portType name="StubPortType">
+    <operation name="getUserData">
+      <input message="tns:getUserDataRequest"/>
+      <output message="tns:getUserDataResponse"/>
+    </operation>
+  </portType>
+  <binding name="StubBinding" type="tns:StubPortType">
+    <soap:binding style="rpc" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="getUserData">
+      <soap:operation soapAction="urn:stub#getUserData"/>
+      <input><soap:body use="encoded" namespace="urn:stub" encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"/></input>
+      <output><soap:body use="encoded" namespace="urn:stub" encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"/></output>
+    </operation>
+  </binding>
+  <service name="StubService">
+    <port name="StubPort" binding="tns:StubBinding"><soap:address location="http://127.0.0.1:9/soap"/></port>
+  </service>
+</definitions>
+'''
+
+
+class WSDLHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.fetches += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(WSDL)))
+        self.end_headers()
+        self.wfile.write(WSDL)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def wsdl_url():
+    server = HTTPServer(('127.0.0.1', 0), WSDLHandler)
+    server.fetches = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f'http://127.0.0.1:{server.server_port}/soap?wsdl'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(radioreference, 'WSDL_CACHE_PATH', str(tmp_path / 'wsdl_cache.db'))
+    monkeypatch.setattr(radioreference, '_clients', {})
+
+
+def make_systems(url):
+    systems = GetSystems('user', 'pass')
+    systems.wsdl_url = url
+    return systems
+
+
+def test_instances_share_one_client(wsdl_url):
+    server, url = wsdl_url
+    client = make_systems(url).client
+    assert make_systems(url).client is client
+    assert server.fetches == 1
+    assert client.service.getUserData is not None
+
+
+def test_new_process_reads_the_wsdl_from_disk(wsdl_url, monkeypatch):
+    server, url = wsdl_url
+    make_systems(url).client
+    assert server.fetches == 1
+
+    # A later run starts with no clients in memory but the same cache file
+    monkeypatch.setattr(radioreference, '_clients', {})
+    client = make_systems(url).client
+    assert server.fetches == 1
+    assert client.service.getUserData is not None
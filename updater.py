@@ -1,33 +1,313 @@
 import time
-import requests
+import queue
 import socket
 import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from types import MappingProxyType
+from lazyimport import LazyImport
 from resources.config import configure
 
-config = configure.Configure('resources/config/config.ini')
+# Only needed once polling starts, importing it is kept off the app's startup path
+requests = LazyImport('requests')
+
+config = configure.get_config('resources/config/config.ini')
 
 op25_ip = config.get(section='RCH', option='op25_ip')
 mch_port = config.get(section='RCH', option='mch_port')
 
-sdr = config.get(section='SDR', option='sdr')
-if 'RTL-SDR' in sdr:
-    sdr = 'rtl'
-samplerate = config.get(section='SDR', option='samplerate')
-gain = config.get(section='SDR', option='gain')
+# Seconds between telemetry polls of the OP25 HTTP terminal. We poll fast while a
+# call is up or the control channel is moving and back off when nothing happens
+FAST_POLL_INTERVAL = 0.5
+IDLE_POLL_INTERVAL = 2
+# Failed polls double the wait up to this ceiling so a dead link isn't hammered
+MAX_BACKOFF_INTERVAL = 30
+
+# Seconds to wait for the mchserver to answer a command that has been sent, and the
+# line ending that marks the end of a reply when the server keeps the socket open
+REPLY_TIMEOUT = 5
+REPLY_TERMINATOR = b'\n'
+
+# Fields we keep from each OP25 update message
+CHANGE_FREQ_FIELDS = (
+    "freq", "tgid", "offset", "tag", "nac", "system", "center_frequency", "tdma", "wacn", "sysid", "tuner",
+    "sigtype", "fine_tune", "error", "stream_url",
+)
+TRUNK_UPDATE_FIELDS = (
+    "top_line", "syid", "rfid", "stid", "sysid", "rxchan", "txchan", "wacn", "secondary", "frequencies",
+    "frequency_data", "last_tsbk", "tsbks", "adjacent_data",
+)
+TRUNK_UPDATE_CALL_FIELDS = ("grpaddr", "encrypted", "srcaddr")
+RX_UPDATE_FIELDS = ("error", "fine_tune", "files")
+
+# Voice channel activity of a sample. 'talkgroups' is the set of tgids on any
+# voice channel, 'occupancy' maps each busy frequency to the tgids on it
+ActiveCalls = namedtuple('ActiveCalls', ['talkgroups', 'occupancy'])
+NO_ACTIVE_CALLS = ActiveCalls(frozenset(), MappingProxyType({}))
+
+# A single telemetry sample published to every subscriber. 'values' is the
+# frozen output of get_latest_values(), 'changes' holds only the fields that
+# differ from the previous sample (a section or field mapped to None has disappeared),
+# 'connected' mirrors connection_successful and 'active_calls' is the ActiveCalls
+TelemetrySnapshot = namedtuple('TelemetrySnapshot', ['values', 'changes', 'connected', 'timestamp', 'active_calls'],
+                               defaults=(NO_ACTIVE_CALLS,))
+
+
+def freeze(value):
+    """Recursively convert dicts and lists into read-only equivalents."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+# Stands in for a field that one of two samples doesn't have
+MISSING = object()
+
+
+def diff_values(previous, current):
+    """Return {section: {field: value}} for every field that changed between two samples.
+
+    A field that is gone from a section is reported with the value None.
+    """
+    changes = {}
+    for section, fields in current.items():
+        previous_fields = previous.get(section)
+        if previous_fields is None:
+            changes[section] = fields
+            continue
+        changed = {}
+        for field in fields.keys() | previous_fields.keys():
+            value = fields.get(field, MISSING)
+            if value is MISSING or value != previous_fields.get(field, MISSING):
+                changed[field] = None if value is MISSING else value
+        if changed:
+            changes[section] = changed
+    for section in previous:
+        if section not in current:
+            changes[section] = None
+    return changes
+
+
+def freeze_changes(previous, current, changes):
+    """Freeze a sample, reusing the previous frozen values for anything unchanged."""
+    frozen = {}
+    for section, fields in current.items():
+        previous_fields = previous.get(section) if previous is not None else None
+        changed = changes.get(section)
+        if previous_fields is not None and not changed:
+            frozen[section] = previous_fields
+        elif previous_fields is None:
+            frozen[section] = freeze(fields)
+        else:
+            frozen[section] = MappingProxyType({
+                field: freeze(value) if field in changed else previous_fields[field]
+                for field, value in fields.items()
+            })
+    return MappingProxyType(frozen)
+
+
+def active_calls(values, previous=None):
+    """Work out the ActiveCalls of a sample from its frozen values.
+
+    freeze_changes() hands on the previous frozen frequency_data while it is
+    unchanged, so if it is the very same object as in the previous snapshot
+    that snapshot's ActiveCalls still holds.
+    """
+    frequency_data = (values.get('trunk_update') or {}).get('frequency_data')
+    if (previous is not None and frequency_data is not None
+            and frequency_data is (previous.values.get('trunk_update') or {}).get('frequency_data')):
+        return previous.active_calls
+    occupancy = {}
+    for freq, freq_data in (frequency_data or {}).items():
+        tgids = tuple(tgid for tgid in (freq_data.get('tgids') or ()) if tgid)
+        if tgids:
+            occupancy[freq] = tgids
+    if not occupancy:
+        return NO_ACTIVE_CALLS
+    return ActiveCalls(frozenset(tgid for tgids in occupancy.values() for tgid in tgids), MappingProxyType(occupancy))
+
+
+def has_changed(changes, section, *fields):
+    """True if a section (or any of the given fields in it) changed in a snapshot."""
+    if section not in changes:
+        return False
+    if changes[section] is None or not fields:
+        return True
+    return any(field in changes[section] for field in fields)
+
+
+class ControlChannel:
+    """Queued command worker for the mchserver.
+
+    Every command gets a Future and is queued to a single worker thread, so
+    callers on the UI thread can fire commands without waiting on the
+    network. Commands are sent in order and replies are read until the server is
+    done instead of a single 1024 byte recv.
+
+    The mchserver speaks one unframed command per connection, so the worker opens
+    a socket per exchange; what it keeps alive is the queue and thread. Only a
+    failed connect or send is retried. Once a command has gone out it is never
+    sent again, as commands like START_SYSTEM or INCREASE_VOLUME would then run
+    twice on the Pi.
+    """
+
+    def __init__(self, host, port, timeout=1, retries=1, reply_timeout=REPLY_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.reply_timeout = reply_timeout
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, command):
+        """Queue a command and return a Future that resolves to the reply."""
+        future = Future()
+        self.ensure_worker()
+        self.queue.put((future, command))
+        return future
+
+    def request(self, command):
+        """Send a command and block until its reply arrives."""
+        # Leave room for the commands queued ahead of us, each may connect once per attempt and read once
+        wait = (self.queue.qsize() + 1) * ((self.retries + 1) * self.timeout + self.reply_timeout)
+        future = self.submit(command)
+        try:
+            return future.result(timeout=wait)
+        except Exception:
+            return 'FAIL'
+
+    def ensure_worker(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run_loop)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            future, command = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                reply = self.exchange(command)
+            except Exception as e:
+                # Anything unexpected fails this command only, the worker keeps serving the queue
+                print(f'[DEBUG] OP25 command {command.split(";")[0]} failed: {e}')
+                reply = 'FAIL'
+            future.set_result(reply)
+
+    def exchange(self, command):
+        name = command.split(";")[0]
+        for attempt in range(self.retries + 1):
+            try:
+                client = socket.create_connection((str(self.host), int(self.port)), timeout=self.timeout)
+            except (OSError, ValueError) as e:
+                print(f'[DEBUG] OP25 command {name} could not connect (attempt {attempt + 1}): {e}')
+                continue
+            with client:
+                try:
+                    client.sendall(command.encode())
+                    # Tell the server the command is complete so it closes once it has replied
+                    client.shutdown(socket.SHUT_WR)
+                except OSError as e:
+                    print(f'[DEBUG] OP25 command {name} could not be sent (attempt {attempt + 1}): {e}')
+                    continue
+                # From here on the command may have run, so it is never retried
+                try:
+                    return self.read_reply(client)
+                except OSError as e:
+                    print(f'[DEBUG] OP25 command {name} got no reply: {e}')
+                    return 'FAIL'
+        return 'FAIL'
+
+    def read_reply(self, client):
+        """Read until the reply ends with REPLY_TERMINATOR or the server closes the connection."""
+        client.settimeout(self.reply_timeout)
+        chunks = []
+        while True:
+            try:
+                chunk = client.recv(4096)
+            except socket.timeout:
+                # A server that neither terminates nor closes, return whatever it sent
+                if chunks:
+                    break
+                raise
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(REPLY_TERMINATOR):
+                break
+        return b''.join(chunks).decode(errors='replace').rstrip(REPLY_TERMINATOR.decode())
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
 
 
 class OP25Client:
-    def __init__(self, url, callback):
+    def __init__(self, url, callback=None):
         self.url = url
-        self.callback = callback
+        self.subscribers = []
+        self.latest_snapshot = None
         self.connection_successful = False
         self.thread = None
         self.stop_event = threading.Event()
+        self.failed_polls = 0
+        self.previous_control_channel = None
+        self.previous_values = {}
+        # Created by the poll thread when polling starts, see create_session()
+        self.session = None
+        self.control = ControlChannel(op25_ip, mch_port)
+        self.capabilities = {}
+        if callback is not None:
+            self.subscribe(callback)
+
+    def set_address(self, host, port, mch_port):
+        """Point polling and commands at a new address, used from the next poll or command on."""
+        self.url = f'http://{host}:{port}'
+        self.control.host = host
+        self.control.port = mch_port
+
+    def subscribe(self, callback):
+        """Register a callback that receives every TelemetrySnapshot.
+
+        Callbacks run on the poll thread, so UI consumers must hand the
+        snapshot over to the Kivy main thread themselves.
+        """
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def publish(self, snapshot):
+        self.latest_snapshot = snapshot
+        for callback in list(self.subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Error in telemetry subscriber: {e}")
+
+    @staticmethod
+    def create_session():
+        # One keep-alive session so polls reuse the same TCP connection to the Pi
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        session.mount('http://', adapter)
+        return session
 
     def jsoncmd(self, command, arg1, arg2):
         try:
             payload = [{"command": command, "arg1": arg1, "arg2": arg2}]
-            response = requests.post(self.url, json=payload, timeout=1)
+            response = self.session.post(self.url, json=payload, timeout=1)
 
             if response.status_code == 200:
                 self.connection_successful = True
@@ -49,53 +329,15 @@ class OP25Client:
             latest_values = {}
             for item in response_data:
                 if item.get("json_type") == "change_freq":
-                    latest_values['change_freq'] = {
-                        "freq": item.get("freq"),
-                        "tgid": item.get("tgid"),
-                        "offset": item.get("offset"),
-                        "tag": item.get("tag"),
-                        "nac": item.get("nac"),
-                        "system": item.get("system"),
-                        "center_frequency": item.get("center_frequency"),
-                        "tdma": item.get("tdma"),
-                        "wacn": item.get("wacn"),
-                        "sysid": item.get("sysid"),
-                        "tuner": item.get("tuner"),
-                        "sigtype": item.get("sigtype"),
-                        "fine_tune": item.get("fine_tune"),
-                        "error": item.get("error"),
-                        "stream_url": item.get("stream_url"),
-                    }
+                    latest_values['change_freq'] = {field: item.get(field) for field in CHANGE_FREQ_FIELDS}
                 elif item.get("json_type") == "trunk_update":
                     trunk_update_data = item.get(str(item.get("nac")))
                     if trunk_update_data:
-                        latest_values['trunk_update'] = {
-                            "top_line": trunk_update_data.get("top_line"),
-                            "syid": trunk_update_data.get("syid"),
-                            "rfid": trunk_update_data.get("rfid"),
-                            "stid": trunk_update_data.get("stid"),
-                            "sysid": trunk_update_data.get("sysid"),
-                            "rxchan": trunk_update_data.get("rxchan"),
-                            "txchan": trunk_update_data.get("txchan"),
-                            "wacn": trunk_update_data.get("wacn"),
-                            "secondary": trunk_update_data.get("secondary"),
-                            "frequencies": trunk_update_data.get("frequencies"),
-                            "frequency_data": trunk_update_data.get("frequency_data"),
-                            "last_tsbk": trunk_update_data.get("last_tsbk"),
-                            "tsbks": trunk_update_data.get("tsbks"),
-                            "adjacent_data": trunk_update_data.get("adjacent_data"),
-                        }
-                    latest_values['trunk_update'].update({
-                        "grpaddr": item.get("grpaddr"),
-                        "encrypted": item.get("encrypted"),
-                        "srcaddr": item.get("srcaddr"),
-                    })
+                        latest_values['trunk_update'] = {field: trunk_update_data.get(field) for field in TRUNK_UPDATE_FIELDS}
+                    latest_values.setdefault('trunk_update', {}).update(
+                        {field: item.get(field) for field in TRUNK_UPDATE_CALL_FIELDS})
                 elif item.get("json_type") == "rx_update":
-                    latest_values['rx_update'] = {
-                        "error": item.get("error"),
-                        "fine_tune": item.get("fine_tune"),
-                        "files": item.get("files"),
-                    }
+                    latest_values['rx_update'] = {field: item.get(field) for field in RX_UPDATE_FIELDS}
             #print(latest_values)
             return latest_values
 
@@ -104,37 +346,87 @@ class OP25Client:
             #return {'change_freq': {'freq': 772731250, 'tgid': None, 'offset': 0, 'tag': '', 'nac': 0, 'system': 'CONNFail', 'center_frequency': None, 'tdma': None, 'wacn': -1, 'sysid': -1, 'tuner': 0, 'sigtype': 'P25', 'fine_tune': 0.0, 'error': 8, 'stream_url': ''}, 'trunk_update': {'top_line': 'NAC 0x0 WACN 0x-1 SYSID 0x-1 0.000000/0.000000 tsbks 0', 'syid': 0, 'rfid': 0, 'stid': 0, 'sysid': -1, 'rxchan': 0, 'txchan': 0, 'wacn': -1, 'secondary': [], 'frequencies': {}, 'frequency_data': {}, 'last_tsbk': 0, 'tsbks': 0, 'adjacent_data': {}}, 'rx_update': {'error': 8, 'fine_tune': 0.0, 'files': []}}
             return {}
 
+    def poll_once(self):
+        latest_values = self.get_latest_values()
+        changes = diff_values(self.previous_values, latest_values)
+        previous = self.latest_snapshot
+        previous_frozen = previous.values if previous is not None else None
+        values = freeze_changes(previous_frozen, latest_values, changes)
+        # Kept up to date here on the poll thread so consumers get O(1) membership checks
+        calls = active_calls(values, previous)
+        snapshot = TelemetrySnapshot(values, freeze(changes), self.connection_successful, time.time(), calls)
+        self.previous_values = latest_values
+        self.publish(snapshot)
+        return snapshot
+
+    @staticmethod
+    def call_active(snapshot):
+        change_freq = snapshot.values.get('change_freq') or {}
+        if change_freq.get('tag'):
+            return True
+        tgid = change_freq.get('tgid')
+        return tgid is not None and tgid in snapshot.active_calls.talkgroups
+
+    def next_poll_interval(self, snapshot):
+        """Work out how long to sleep before the next poll."""
+        latest_values = snapshot.values
+        if not self.connection_successful:
+            self.failed_polls += 1
+            return min(IDLE_POLL_INTERVAL * 2 ** (self.failed_polls - 1), MAX_BACKOFF_INTERVAL)
+        self.failed_polls = 0
+
+        trunk_update = latest_values.get('trunk_update') or {}
+        control_channel = (trunk_update.get('rfid'), trunk_update.get('stid'), trunk_update.get('rxchan'))
+        control_channel_changed = control_channel != self.previous_control_channel
+        self.previous_control_channel = control_channel
+
+        if control_channel_changed or self.call_active(snapshot):
+            return FAST_POLL_INTERVAL
+        return IDLE_POLL_INTERVAL
+
     def run_loop(self):
+        # This is the only place OP25's HTTP terminal gets polled, everyone else subscribes
         #self.start_op25() # We can start this later outside of the loop
         try:
+            if self.session is None:
+                self.session = self.create_session()
             while not self.stop_event.is_set():
-                latest_values = self.get_latest_values()
-                self.callback(latest_values)
-                time.sleep(2)
+                snapshot = self.poll_once()
+                self.stop_event.wait(self.next_poll_interval(snapshot))
         except:
             print('DEBUG: Failed to make connection')
 
 
     def send_cmd_to_op25(self, command):
+        # Blocks until the server replies, returns 'FAIL' if it never does
+        return self.control.request(command)
 
-            try:
-                host = str(op25_ip)
-                port = int(mch_port)
-                client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client.settimeout(1)
-
-                client.connect((host, port))
-                client.send(command.encode())
-                response = client.recv(1024).decode()
-                print('[DEBUG] Connecting to OP25 server')
-                return response
-            except:
-                return 'FAIL'
+    def send_cmd_to_op25_async(self, command):
+        # Fire and forget, for UI actions that don't need the reply
+        return self.control.submit(command)
+
+    def supports(self, command):
+        """Ask the mchserver whether it knows a command, the answer is remembered.
+
+        Servers that predate SUPPORTS answer with a NACK or not at all, which
+        counts as not supported. No answer isn't remembered, the Pi may be down.
+        """
+        if command not in self.capabilities:
+            response = self.send_cmd_to_op25(f'SUPPORTS;{command}')
+            if response == 'FAIL':
+                return False
+            self.capabilities[command] = 'ACK' in response and 'NACK' not in response
+        return self.capabilities[command]
 
     def manual_start_op25(self):
         response = self.send_cmd_to_op25('HELLO')
         if 'HELLO' in response:
             print(response)
+            # Read at start time so SDR settings changed since launch are used
+            sdr = config.get(section='SDR', option='sdr')
+            if 'RTL-SDR' in sdr:
+                sdr = 'rtl'
+            gain = config.get(section='SDR', option='gain')
             start_response = self.send_cmd_to_op25(f'MANUAL_START;{sdr};{gain}')
             if "ACK" in start_response:
                 print('Starting OP25')
@@ -144,12 +436,13 @@ class OP25Client:
             time.sleep(1)
 
     def stop_op25(self):
-        self.send_cmd_to_op25('STOP_OP25')
+        self.send_cmd_to_op25_async('STOP_OP25')
         return "ACK"
 
 
     def start(self):
         if self.thread is None:
+            self.stop_event.clear()
             self.thread = threading.Thread(target=self.run_loop)
             self.thread.daemon = True
             self.thread.start()
@@ -159,14 +452,17 @@ class OP25Client:
             self.stop_event.set()
             self.thread.join()
             self.thread = None
+            if self.session is not None:
+                self.session.close()
+                self.session = None
 
     def is_running(self):
         return self.thread is not None and self.thread.is_alive()
 
 
 # Example usage
-def process_latest_values(latest_values):
-    print("Processing latest values:", latest_values)
+def process_latest_values(snapshot):
+    print("Processing latest values:", snapshot.values)
 
 # if __name__ == "__main__":
 #     client = OP25Client("http://192.168.4.1:8080", process_latest_values)
@@ -0,0 +1,290 @@
+import os
+import sys
+import csv
+import mmap
+import time
+import heapq
+import random
+import struct
+from array import array
+from math import radians, sin, cos, sqrt, atan2, floor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.19
+
+# Size of a grid cell in degrees, roughly 55km north/south
+CELL_SIZE = 0.5
+
+# Packed file layout, all little endian:
+#   header      magic, point count, cell count, cell size
+#   zips        int32[points]
+#   lats, lons  float32[points] each
+#   cell keys   int32[cells * 2], (lat cell, lon cell) pairs in point order
+#   cell starts int32[cells + 1], offset of each cell's first point
+PACKED_MAGIC = b'ZIPIDX2\0'
+PACKED_HEADER = struct.Struct('<8sIId')
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def cell_of(lat, lon):
+    return floor(lat / CELL_SIZE), floor(lon / CELL_SIZE)
+
+
+class ZipIndex:
+    """Nearest ZIP code lookups over a lat/lon grid.
+
+    Points are stored in flat arrays sorted by grid cell, and each cell maps to a
+    slice of those arrays. A query scans rings of cells outward from the query
+    point and stops as soon as nothing outside the scanned area can be closer.
+    """
+
+    def __init__(self, zips, lats, lons, cells=None):
+        self.zips = zips
+        self.lats = lats
+        self.lons = lons
+        self.cells = cells
+        self.mapped = None
+        if self.cells is None:
+            self.build_cells()
+
+    @classmethod
+    def from_points(cls, points):
+        # points is an iterable of (zip, lat, lon), sort them into cell order
+        points = sorted(points, key=lambda point: cell_of(point[1], point[2]))
+        return cls(array('i', (int(point[0]) for point in points)),
+                   array('f', (point[1] for point in points)),
+                   array('f', (point[2] for point in points)))
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        with open(csv_path, newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            return cls.from_points((row['zip'], float(row['lat']), float(row['lng'])) for row in reader)
+
+    @classmethod
+    def load(cls, csv_path, packed_path=None):
+        """Memory map the packed ZIP file, building it from the CSV first if it is missing or stale."""
+        if packed_path is None:
+            packed_path = os.path.splitext(csv_path)[0] + '.bin'
+        if os.path.exists(packed_path) and (not os.path.exists(csv_path)
+                                            or os.path.getmtime(packed_path) >= os.path.getmtime(csv_path)):
+            try:
+                return cls.open_packed(packed_path)
+            except (OSError, ValueError) as e:
+                print(f"Rebuilding ZIP index, packed file unreadable: {e}")
+        index = cls.from_csv(csv_path)
+        try:
+            index.write_packed(packed_path)
+        except OSError as e:
+            print(f"Unable to write packed ZIP index: {e}")
+        return index
+
+    @classmethod
+    def open_packed(cls, packed_path):
+        with open(packed_path, 'rb') as packed_file:
+            mapped = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count, cell_count, cell_size = PACKED_HEADER.unpack_from(mapped)
+            if magic != PACKED_MAGIC or cell_size != CELL_SIZE:
+                raise ValueError("unknown ZIP index format")
+            if sys.byteorder != 'little':
+                raise ValueError("packed ZIP index requires a little endian host")
+            view = memoryview(mapped)
+            offset = PACKED_HEADER.size
+
+            def section(code, length):
+                nonlocal offset
+                end = offset + length * 4
+                if end > len(mapped):
+                    raise ValueError("packed ZIP index is truncated")
+                part = view[offset:end].cast(code)
+                offset = end
+                return part
+
+            zips = section('i', count)
+            lats = section('f', count)
+            lons = section('f', count)
+            cell_keys = section('i', cell_count * 2)
+            cell_starts = section('i', cell_count + 1)
+        except Exception:
+            mapped.close()
+            raise
+        # Only the small cell table is copied into Python objects, the points stay mapped
+        cells = {(cell_keys[i * 2], cell_keys[i * 2 + 1]): (cell_starts[i], cell_starts[i + 1])
+                 for i in range(cell_count)}
+        index = cls(zips, lats, lons, cells)
+        index.mapped = mapped
+        return index
+
+    def write_packed(self, packed_path):
+        # Cells are stored in point order so their starts line up with the point arrays
+        ordered = sorted(self.cells.items(), key=lambda item: item[1][0])
+        cell_keys = array('i')
+        cell_starts = array('i')
+        for (cell_lat, cell_lon), (start, end) in ordered:
+            cell_keys.extend((cell_lat, cell_lon))
+            cell_starts.append(start)
+        cell_starts.append(len(self.zips))
+
+        # Write to a temp file first so a half written file is never picked up
+        temp_path = packed_path + '.tmp'
+        with open(temp_path, 'wb') as packed_file:
+            packed_file.write(PACKED_HEADER.pack(PACKED_MAGIC, len(self.zips), len(ordered), CELL_SIZE))
+            for values in (self.zips, self.lats, self.lons, cell_keys, cell_starts):
+                if sys.byteorder != 'little':
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                packed_file.write(bytes(values))
+        os.replace(temp_path, packed_path)
+
+    def build_cells(self):
+        # Points are already in cell order, so each cell is one contiguous run
+        self.cells = {}
+        start = 0
+        current = None
+        for i in range(len(self.zips)):
+            cell = cell_of(self.lats[i], self.lons[i])
+            if cell != current:
+                if current is not None:
+                    self.cells[current] = (start, i)
+                current = cell
+                start = i
+        if current is not None:
+            self.cells[current] = (start, len(self.zips))
+
+    def __len__(self):
+        return len(self.zips)
+
+    def close(self):
+        if self.mapped is not None:
+            self.zips = self.lats = self.lons = array('i')
+            self.cells = {}
+            self.mapped.close()
+            self.mapped = None
+
+    def ring(self, cell_lat, cell_lon, radius):
+        # Every cell exactly `radius` steps away from the centre cell
+        if radius == 0:
+            yield cell_lat, cell_lon
+            return
+        for dlon in range(-radius, radius + 1):
+            yield cell_lat - radius, cell_lon + dlon
+            yield cell_lat + radius, cell_lon + dlon
+        for dlat in range(-radius + 1, radius):
+            yield cell_lat + dlat, cell_lon - radius
+            yield cell_lat + dlat, cell_lon + radius
+
+    def unscanned_distance(self, lat, lon, cell_lat, cell_lon, radius):
+        # Lower bound on the distance to any point outside the cells scanned so far
+        lat_gap = min(lat - (cell_lat - radius) * CELL_SIZE, (cell_lat + radius + 1) * CELL_SIZE - lat)
+        lon_gap = min(lon - (cell_lon - radius) * CELL_SIZE, (cell_lon + radius + 1) * CELL_SIZE - lon)
+        widest_lat = min(89.9, abs(lat) + (radius + 1) * CELL_SIZE)
+        return min(lat_gap * KM_PER_DEGREE, lon_gap * KM_PER_DEGREE * cos(radians(widest_lat)))
+
+    def k_nearest(self, lat, lon, k=1):
+        """Return up to k (distance_km, zip) tuples, closest first."""
+        if not self.cells:
+            return []
+        k = min(k, len(self.zips))
+        cell_lat, cell_lon = cell_of(lat, lon)
+        max_radius = int(360 / CELL_SIZE)
+        # Max-heap of the best k so far, stored as negative distances
+        best = []
+        for radius in range(max_radius + 1):
+            for cell in self.ring(cell_lat, cell_lon, radius):
+                bounds = self.cells.get(cell)
+                if bounds is None:
+                    continue
+                for i in range(*bounds):
+                    distance = haversine_distance(lat, lon, self.lats[i], self.lons[i])
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, self.zips[i]))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, self.zips[i]))
+            if len(best) == k and -best[0][0] <= self.unscanned_distance(lat, lon, cell_lat, cell_lon, radius):
+                break
+        return sorted((-distance, zip_code) for distance, zip_code in best)
+
+    def nearest(self, lat, lon):
+        """Return the ZIP code closest to lat/lon as a zero padded string, or None."""
+        result = self.k_nearest(lat, lon, 1)
+        if not result:
+            return None
+        return format_zip(result[0][1])
+
+    def linear_scan(self, lat, lon, k=1):
+        """Brute force k nearest, vectorised with NumPy when it is installed."""
+        if numpy is not None:
+            lats = numpy.radians(numpy.frombuffer(self.lats, dtype=numpy.float32).astype(numpy.float64))
+            lons = numpy.radians(numpy.frombuffer(self.lons, dtype=numpy.float32).astype(numpy.float64))
+            lat1, lon1 = radians(lat), radians(lon)
+            a = numpy.sin((lats - lat1) / 2) ** 2 + cos(lat1) * numpy.cos(lats) * numpy.sin((lons - lon1) / 2) ** 2
+            distances = EARTH_RADIUS_KM * 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+            order = numpy.argsort(distances)[:k]
+            return [(float(distances[i]), self.zips[i]) for i in order]
+        return heapq.nsmallest(k, ((haversine_distance(lat, lon, self.lats[i], self.lons[i]), self.zips[i])
+                                   for i in range(len(self.zips))))
+
+
+def format_zip(zip_code):
+    return f"{zip_code:05d}"
+
+
+def build(csv_path, packed_path):
+    """Convert the ZIP CSV into the packed file shipped with the app."""
+    start = time.perf_counter()
+    index = ZipIndex.from_csv(csv_path)
+    index.write_packed(packed_path)
+    print(f"Packed {len(index)} ZIP codes into {packed_path} ({os.path.getsize(packed_path)} bytes) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+def benchmark(csv_path):
+    # Compares the grid against a linear scan, using uszips.csv if it is present
+    if os.path.exists(csv_path):
+        index = ZipIndex.from_csv(csv_path)
+    else:
+        print(f"{csv_path} not found, using synthetic points")
+        rng = random.Random(1)
+        index = ZipIndex.from_points((i, rng.uniform(25, 49), rng.uniform(-124, -67)) for i in range(33000))
+
+    rng = random.Random(2)
+    queries = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(200)]
+
+    start = time.perf_counter()
+    grid_results = [index.k_nearest(lat, lon, 5) for lat, lon in queries]
+    grid_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    scan_results = [index.linear_scan(lat, lon, 5) for lat, lon in queries]
+    scan_time = (time.perf_counter() - start) / len(queries)
+
+    mismatches = sum(1 for grid, scan in zip(grid_results, scan_results)
+                     if [z for _, z in grid] != [z for _, z in scan])
+    print(f"{len(index)} points, {len(index.cells)} cells")
+    print(f"grid index:  {grid_time * 1000:.3f} ms/query (k=5)")
+    print(f"linear scan: {scan_time * 1000:.3f} ms/query (k=5, numpy={'yes' if numpy else 'no'})")
+    print(f"mismatched results: {mismatches}")
+
+
+# python zipindex.py build [csv] [bin]   pack the CSV for shipping with the app
+# python zipindex.py [csv]               benchmark the grid against a linear scan
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        csv_path = sys.argv[2] if len(sys.argv) > 2 else 'resources/uszips.csv'
+        packed_path = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(csv_path)[0] + '.bin'
+        build(csv_path, packed_path)
+    else:
+        benchmark(sys.argv[1] if len(sys.argv) > 1 else 'resources/uszips.csv')